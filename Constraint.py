@@ -0,0 +1,65 @@
+class Constraint:
+    """
+    Delivery constraints of a package, parsed once from its special note
+    - Packages without a constraining note share Constraint.NONE
+    """
+    __slots__ = ('pinned_truck', 'available_after', 'group', 'corrected_at')
+    # the hub learns the right address of a "Wrong address listed" package at 10:20 am
+    ADDRESS_CORRECTION = 10 * 3600 + 20 * 60
+
+    def __init__(self, pinned_truck=None, available_after=None, group=(), corrected_at=None):
+        """
+        O(1) - Initializing the constraint
+        - pinned_truck: Integer, the only truck the package can be on
+        - available_after: Integer, seconds since midnight the package reaches the hub
+        - group: Tuple of package ids that must be delivered on the same truck
+        - corrected_at: Integer, seconds since midnight the listed (wrong) address is corrected
+        """
+        self.pinned_truck = pinned_truck
+        self.available_after = available_after
+        self.group = group
+        self.corrected_at = corrected_at
+
+    @classmethod
+    def parse(cls, note):
+        """
+        O(len(note)) - Constraint of a special note, Constraint.NONE for an empty or harmless note
+        - Understands "Can only be on truck N", "Delayed ... until H:MM am", "Must be delivered with A, B"
+          and "Wrong address listed"
+
+        returns Constraint
+        """
+        if 'on truck' in note:
+            return cls(pinned_truck=int(note.split()[-1]))
+        if 'Wrong address' in note:
+            return cls(corrected_at=Constraint.ADDRESS_CORRECTION)
+        if 'delivered with' in note:
+            return cls(group=tuple(int(item) for item in note[note.find('with') + 5:].split(', ')))
+        if 'Delayed' in note:
+            time_str = next(word for word in note.split() if word[0].isdigit())
+            hour, minute = time_str.split(':')[:2]
+            return cls(available_after=int(hour) * 3600 + int(minute[:2]) * 60)
+        return Constraint.NONE
+
+    def __bool__(self):
+        """
+        O(1) - Checks if the package has any constraint
+        """
+        return (self.pinned_truck is not None or self.available_after is not None or bool(self.group)
+                or self.corrected_at is not None)
+
+    def allows(self, truck_id, departure):
+        """
+        O(1) - Checks if the package can ride a truck (its co-delivery group has to go along, see DeliveryGroups)
+        - departure: Integer, seconds since midnight the truck leaves the hub
+
+        returns boolean
+        """
+        if self.pinned_truck is not None and self.pinned_truck != truck_id:
+            return False
+        if self.available_after is not None and departure < self.available_after:
+            return False
+        return self.corrected_at is None or departure >= self.corrected_at
+
+
+Constraint.NONE = Constraint()
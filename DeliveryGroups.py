@@ -0,0 +1,65 @@
+class DeliveryGroups:
+    """
+    Union-find over package ids: the transitive closure of "must be delivered with" constraints
+    - Near-linear: union by size and path halving keep every find almost O(1)
+    - find and union work on any hashable ids (rebalance also joins the stops of a group with it)
+    """
+    __slots__ = ('parent', 'size')
+
+    def __init__(self, packages=()):
+        """
+        O(n) - Initializing the groups
+        - parent: Dictionary of package id -> parent id in its tree (roots point to themselves)
+        - size: Dictionary of root id -> number of package ids in its group
+        """
+        self.parent = {}
+        self.size = {}
+        for package in packages:
+            self.add(package)
+
+    def add(self, package):
+        """
+        O(k) - Adds a package and joins it with every package its constraint names
+        """
+        self.find(package.id)
+        for member in package.constraint.group:
+            self.union(package.id, member)
+
+    def find(self, package_id):
+        """
+        O(α(n)) - Id representing the package's group (a package seen for the first time is its own group)
+        """
+        parent = self.parent
+        if package_id not in parent:
+            parent[package_id] = package_id
+            self.size[package_id] = 1
+            return package_id
+        while parent[package_id] != package_id:
+            parent[package_id] = parent[parent[package_id]]
+            package_id = parent[package_id]
+        return package_id
+
+    def union(self, a, b):
+        """
+        O(α(n)) - Joins the groups of two package ids, the smaller tree goes under the larger one
+        """
+        a, b = self.find(a), self.find(b)
+        if a == b:
+            return
+        if self.size[a] < self.size[b]:
+            a, b = b, a
+        self.parent[b] = a
+        self.size[a] += self.size.pop(b)
+
+    def members(self):
+        """
+        O(n) - Every group of more than one package
+
+        returns dictionary of group id -> list of package ids
+        """
+        groups = {}
+        for package_id in self.parent:
+            root = self.find(package_id)
+            if self.size[root] > 1:
+                groups.setdefault(root, []).append(package_id)
+        return groups
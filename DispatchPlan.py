@@ -0,0 +1,120 @@
+from datetime import timedelta
+import hashlib
+import json
+import os
+
+from Package import MIDNIGHT
+from Timeline import seconds
+
+
+class DispatchPlan:
+    """
+    The result of a dispatch, saved to disk so later runs can skip loading and routing
+    - Routes, per-stop arrival times and package assignments of every truck
+    - A hash of the input csvs, a plan is only reused while the inputs are unchanged
+    - The planner that built it, a plan is only reused for the same planner (see helper.dispatch)
+    """
+    FORMAT = 3
+
+    def __init__(self, inputs, trucks, planner='loads'):
+        """
+        O(1) - Initializing the plan
+        - inputs: String, hash of the input csvs (see fingerprint)
+        - trucks: List of dictionaries, one per truck with its id, driver, departure (seconds since midnight),
+          route (location ids), arrivals (seconds since midnight at each route stop after the first),
+          distance, packages (package ids) and locations (the location id each package is delivered to,
+          which differs from its csv address once a wrong address is corrected)
+        - planner: String, 'loads' or 'trips'
+        """
+        self.inputs = inputs
+        self.trucks = trucks
+        self.planner = planner
+
+    @staticmethod
+    def fingerprint(*paths):
+        """
+        O(file size) - Hash of the contents of the input files
+
+        returns hex digest string
+        """
+        digest = hashlib.sha1()
+        for path in paths:
+            with open(path, 'rb') as input_file:
+                digest.update(hashlib.sha1(input_file.read()).digest())
+        return digest.hexdigest()
+
+    @classmethod
+    def from_trucks(cls, inputs, trucks, distances, planner='loads'):
+        """
+        O(n) - Plan of dispatched trucks, arrival times are walked from each truck's departure
+
+        returns DispatchPlan
+        """
+        plans = []
+        for truck in trucks:
+            time = seconds(truck.departure_time)
+            arrivals = []
+            for current_location, next_location in zip(truck.route, truck.route[1:]):
+                time += distances.d(current_location, next_location) / truck.mph * 3600
+                arrivals.append(round(time, 3))
+            plans.append({'id': truck.id, 'driver': truck.driver, 'departure': round(seconds(truck.departure_time), 3),
+                          'route': truck.route, 'arrivals': arrivals,
+                          'distance': distances.route_length(truck.route),
+                          'packages': [parcel.id for parcel in truck.packages],
+                          'locations': [parcel.location_id for parcel in truck.packages]})
+        return cls(inputs, plans, planner)
+
+    @classmethod
+    def load(cls, path):
+        """
+        O(n) - Reads a saved plan
+
+        returns DispatchPlan, or None if there is no plan or it was saved in another format
+        """
+        if not os.path.exists(path):
+            return None
+        with open(path) as plan_file:
+            data = json.load(plan_file)
+        if data.get('format') != DispatchPlan.FORMAT:
+            return None
+        return cls(data['inputs'], data['trucks'], data['planner'])
+
+    def save(self, path):
+        """
+        O(n) - Writes the plan as compact JSON (to a temporary file, then renamed)
+        """
+        temporary = path + '.tmp'
+        with open(temporary, 'w') as plan_file:
+            json.dump({'format': DispatchPlan.FORMAT, 'inputs': self.inputs, 'planner': self.planner,
+                       'trucks': self.trucks}, plan_file, separators=(',', ':'))
+        os.replace(temporary, path)
+
+    def apply(self, trucks, package_table):
+        """
+        O(n) - Restores the planned routes, drivers, assignments, departures and delivery times onto trucks
+        - trucks: empty trucks with the same ids as the planned ones
+        - package_table: PackageHt holding the packages read from the unchanged csv
+
+        returns the trucks
+        """
+        by_id = {truck.id: truck for truck in trucks}
+        for plan in self.trucks:
+            truck = by_id[plan['id']]
+            truck.driver = plan['driver']
+            truck.departure_time = MIDNIGHT + timedelta(seconds=plan['departure'])
+            truck.route = plan['route']
+            truck.total_distance = plan['distance']
+            truck.timeline = None
+
+            delivered_at = {}
+            for location, arrival in zip(truck.route[1:], plan['arrivals']):
+                delivered_at.setdefault(location, arrival)
+            for package_id, location_id in zip(plan['packages'], plan['locations']):
+                parcel = package_table.lookup(package_id)
+                parcel.location_id = location_id
+                truck.assign_package(parcel)
+                parcel.assign_truck(truck)
+                parcel.dispatch_seconds = round(plan['departure'])
+                parcel.delivery_seconds = round(delivered_at[parcel.location_id])
+
+        return trucks
@@ -0,0 +1,158 @@
+import json
+import os
+import time
+
+# equal-width buckets in a histogram summary
+BUCKETS = 10
+
+
+class DispatchStats:
+    """
+    Instrumentation of a dispatch: per-stage timers, event counters and histograms of observed values
+    - Stages can nest (routing runs inside dispatch), each stage name keeps its own total
+    - DispatchStats.OFF is disabled and ignores every call, instrumented code passes it by default
+    """
+    __slots__ = ('enabled', 'timers', 'counters', 'histograms')
+    FORMAT = 1
+
+    def __init__(self, enabled=True):
+        """
+        O(1) - Initializing the stats
+        - enabled: Boolean, False makes every call a no-op
+        - timers: Dictionary of stage name -> [total seconds, number of runs]
+        - counters: Dictionary of counter name -> Integer
+        - histograms: Dictionary of histogram name -> list of observed values
+        """
+        self.enabled = enabled
+        self.timers = {}
+        self.counters = {}
+        self.histograms = {}
+
+    def __bool__(self):
+        """
+        O(1) - Checks if the stats are recording, lets hot loops skip building what they would record
+        """
+        return self.enabled
+
+    def stage(self, name):
+        """
+        O(1) - Times a stage, used as "with stats.stage('routing'):"
+
+        returns context manager
+        """
+        if not self.enabled:
+            return _IDLE
+        return _Stage(self, name)
+
+    def add_time(self, name, seconds):
+        """
+        O(1) - Adds one run of a stage that was timed elsewhere
+        """
+        if self.enabled:
+            timer = self.timers.get(name)
+            if timer is None:
+                self.timers[name] = [seconds, 1]
+            else:
+                timer[0] += seconds
+                timer[1] += 1
+
+    def count(self, name, amount=1):
+        """
+        O(1) - Adds to a counter
+        """
+        if self.enabled:
+            self.counters[name] = self.counters.get(name, 0) + amount
+
+    def observe(self, name, value):
+        """
+        O(1) - Adds a value to a histogram
+        """
+        if self.enabled:
+            self.histograms.setdefault(name, []).append(value)
+
+    def summary(self, name):
+        """
+        O(n log n) - Summary of a histogram: count, min, mean, median, p90, max and equal-width bucket counts
+
+        returns dictionary, or None if nothing was observed
+        """
+        values = sorted(self.histograms.get(name, ()))
+        if not values:
+            return None
+        low, high = values[0], values[-1]
+        width = (high - low) / BUCKETS or 1
+        buckets = [0] * BUCKETS
+        for value in values:
+            buckets[min(int((value - low) / width), BUCKETS - 1)] += 1
+        return {'count': len(values), 'min': low, 'mean': sum(values) / len(values),
+                'p50': values[len(values) // 2], 'p90': values[int(len(values) * 0.9)], 'max': high,
+                'bucket_width': width, 'buckets': buckets}
+
+    def to_dict(self):
+        """
+        O(n log n) - Stats as plain data, histograms are summarized
+
+        returns dictionary
+        """
+        return {'format': DispatchStats.FORMAT,
+                'stages': {name: {'seconds': total, 'runs': runs} for name, (total, runs) in self.timers.items()},
+                'counters': dict(self.counters),
+                'histograms': {name: self.summary(name) for name in self.histograms}}
+
+    def save(self, path):
+        """
+        O(n log n) - Writes the stats as JSON (to a temporary file, then renamed)
+        """
+        temporary = path + '.tmp'
+        with open(temporary, 'w') as stats_file:
+            json.dump(self.to_dict(), stats_file, indent=2)
+        os.replace(temporary, path)
+
+    def __str__(self):
+        """
+        O(n log n) - One line per stage, counter and histogram
+        """
+        lines = [f'{name:<24} {total:10.4f}s  runs={runs}' for name, (total, runs) in self.timers.items()]
+        lines += [f'{name:<24} {value}' for name, value in self.counters.items()]
+        for name in self.histograms:
+            numbers = self.summary(name)
+            lines.append(f"{name:<24} count={numbers['count']}  min={numbers['min']:.4g}  "
+                         f"p50={numbers['p50']:.4g}  p90={numbers['p90']:.4g}  max={numbers['max']:.4g}")
+        return '\n'.join(lines)
+
+
+class _Stage:
+    """
+    Context manager timing one run of a stage
+    """
+    __slots__ = ('stats', 'name', 'start')
+
+    def __init__(self, stats, name):
+        self.stats = stats
+        self.name = name
+        self.start = None
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.stats.add_time(self.name, time.perf_counter() - self.start)
+        return False
+
+
+class _Idle:
+    """
+    Context manager of disabled stats, does nothing
+    """
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+
+_IDLE = _Idle()
+DispatchStats.OFF = DispatchStats(enabled=False)
@@ -0,0 +1,87 @@
+from array import array
+import csv
+import hashlib
+
+
+class DistanceMatrix:
+    """
+    Symmetric distance matrix stored as a flat array of doubles
+    """
+
+    def __init__(self, locations, values):
+        """
+        O(n) - Initializing the distance matrix
+        - locations: List of Strings, first line of each address (index = location id)
+        - values: array('d') of size n * n, row major, mirrored so d(i, j) == d(j, i)
+        - location_index: Dictionary of address -> location id
+        - fingerprint: String, hash of the table once version() has computed it
+        """
+        self.locations = locations
+        self.location_index = {address: i for i, address in enumerate(locations)}
+        self.size = len(locations)
+        self.values = values
+        self.fingerprint = None
+
+    @classmethod
+    def from_csv(cls, path):
+        """
+        O(n^2) - Loads the lower-triangular distance csv and mirrors it into a full matrix
+
+        returns the distance matrix
+        """
+        with open(path) as distance_file:
+            reader = csv.reader(distance_file)
+            addresses = next(reader)[2:]
+            size = len(addresses)
+            locations = [address.splitlines()[1].strip(', ')
+                         for address in addresses]
+            values = array('d', bytes(8 * size * size))
+
+            for i, row in enumerate(reader):
+                for j, distance in enumerate(row[2:i + 3]):
+                    if distance:
+                        values[i * size + j] = float(distance)
+                        values[j * size + i] = float(distance)
+
+        return cls(locations, values)
+
+    def __len__(self):
+        """
+        O(1) - Number of locations in the matrix
+        """
+        return self.size
+
+    def version(self):
+        """
+        O(n^2) once, then O(1) - Hash of the locations and distances, changes whenever the table does
+
+        returns hex digest string
+        """
+        if self.fingerprint is None:
+            digest = hashlib.sha1('\n'.join(self.locations).encode())
+            digest.update(self.values.tobytes())
+            self.fingerprint = digest.hexdigest()
+        return self.fingerprint
+
+    def location_id(self, address):
+        """
+        O(1) - Location id of an address (first line only)
+        """
+        try:
+            return self.location_index[address]
+        except KeyError:
+            raise LookupError(f"Address not in the distance table: {address}")
+
+    def d(self, i, j):
+        """
+        O(1) - Distance between location i and location j
+        """
+        return self.values[i * self.size + j]
+
+    def route_length(self, route):
+        """
+        O(n) - Total distance of a route given as a list of location ids
+        """
+        size = self.size
+        return sum(map(self.values.__getitem__,
+                       [a * size + b for a, b in zip(route, route[1:])]))
@@ -0,0 +1,78 @@
+from array import array
+
+from Timeline import Timeline, seconds
+
+
+class FleetSimulator:
+    """
+    Whole-fleet positions at many times at once
+    - Each truck's route is flattened once into parallel arrays of stop times, cumulative miles and location ids
+    - A batch of query times is sorted once and swept through every truck's arrays, so a whole day of
+      minute-by-minute playback is O(t * (n + q)) instead of a bisect per truck per time
+    - Positions match Timeline.truck_at: the latest stop reached (the previous one while en route)
+      and the miles driven, counted between stops at the truck's speed
+    """
+
+    def __init__(self, trucks, distances):
+        """
+        O(n) - Flattens every truck's delivery timeline once (a truck without one has it built, see Truck.execute_route)
+        - trucks: Dictionary of truck id -> (stop times, cumulative miles, location ids, mph), times are
+          seconds since midnight in array('d'), the first entry is the departure from the hub
+        """
+        self.trucks = {}
+        for truck in trucks:
+            if truck.timeline is None or truck.id not in truck.timeline.trucks:
+                Timeline().add_truck(truck, distances)
+            times, events, mph = truck.timeline.trucks[truck.id]
+
+            # one entry per stop, deliveries share their stop's time and miles
+            stops = [(time, event) for time, event in zip(times, events) if event[0] != Timeline.DELIVER]
+            self.trucks[truck.id] = (array('d', [time for time, _ in stops]),
+                                     array('d', [event[2] for _, event in stops]),
+                                     array('i', [event[1] for _, event in stops]), mph)
+
+    def simulate(self, moments):
+        """
+        O(q log q + t * (n + q)) - Location and miles of every truck at every time
+        - moments: seconds since midnight (or times / datetimes), in any order
+
+        returns dictionary of truck id -> (array('i') of location ids, array('d') of miles), in the order of moments
+        """
+        moments = [seconds(moment) for moment in moments]
+        order = sorted(range(len(moments)), key=moments.__getitem__)
+        positions = {}
+        for truck_id, (times, cumulative, locations, mph) in self.trucks.items():
+            at = array('i', bytes(4 * len(moments)))
+            miles = array('d', bytes(8 * len(moments)))
+            last = len(times) - 1
+            i = -1
+            # the stop pointer only moves forward as the sorted times increase
+            for q in order:
+                time = moments[q]
+                while i < last and times[i + 1] <= time:
+                    i += 1
+                if i < 0:
+                    at[q] = locations[0]
+                elif i < last:
+                    at[q] = locations[i]
+                    miles[q] = cumulative[i] + mph * (time - times[i]) / 3600
+                else:
+                    at[q] = locations[i]
+                    miles[q] = cumulative[i]
+            positions[truck_id] = (at, miles)
+        return positions
+
+    def finished(self, truck_id):
+        """
+        O(1) - Seconds since midnight the truck reaches the end of its route
+        """
+        return self.trucks[truck_id][0][-1]
+
+    def playback(self, start, end, step=60):
+        """
+        O(t * (n + q)) - Positions of every truck from start to end (inclusive), every step seconds
+
+        returns list of times and the positions from simulate
+        """
+        moments = list(range(round(seconds(start)), round(seconds(end)) + 1, step))
+        return moments, self.simulate(moments)
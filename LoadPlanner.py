@@ -0,0 +1,183 @@
+from collections import deque
+import heapq
+
+from DeliveryGroups import DeliveryGroups
+from Timeline import seconds
+
+
+class LoadPlanner:
+    """
+    Sorts packages into truck loads with dictionary and set indexes instead of list scans
+    - Packages are added one at a time as the manifest is read and bucketed by deadline,
+      the loads are planned once every package is in
+    - Each package is placed on exactly one truck
+    - Co-delivery groups (transitively closed) are placed as one unit, on a truck with room for all of them
+    """
+
+    def __init__(self, end_of_day, capacity, trucks=(1, 2, 3)):
+        """
+        O(1) - Initializing the planner
+        - end_of_day: datetime, deadline of packages without a deadline
+        - capacity: Integer, packages per truck for the location matching and overflow rules
+        - trucks: Tuple of truck numbers, in priority order
+        - by_deadline: Dictionary of deadline (seconds since midnight) -> packages, in the order they were added
+        - groups: DeliveryGroups of the packages added so far
+        """
+        self.end_of_day = seconds(end_of_day)
+        self.capacity = capacity
+        self.trucks = trucks
+        self.by_deadline = {}
+        self.groups = DeliveryGroups()
+
+    def add(self, package):
+        """
+        O(1) - Adds a package to the plan
+        """
+        self.by_deadline.setdefault(package.deadline_seconds, []).append(package)
+        self.groups.add(package)
+
+    def plan(self):
+        """
+        O(n + d log d) - Sort the packages (d distinct deadlines) into truck load lists based on:
+        - Special notes (pinned truck, wrong address, delivered with, delayed)
+        - Deadlines, on a truck already going to the same address or zip
+        - Locations, filling trucks with packages for addresses and then zips they already visit
+        - Whatever is left goes to the emptiest truck
+
+        returns: dictionary of loads, filled with package ids for each truck
+        """
+        packages = [package for deadline in sorted(self.by_deadline) for package in self.by_deadline[deadline]]
+
+        loads = {truck: [] for truck in self.trucks}
+        # packages placed by notes and deadlines, later packages are matched to their locations
+        anchors = {truck: [] for truck in self.trucks}
+        placed = set()
+
+        def place(package, truck, anchor=True):
+            loads[truck].append(package.id)
+            placed.add(package.id)
+            if anchor:
+                anchors[truck].append(package)
+
+        # members of each co-delivery group in deadline order (ids named in a note but not in the manifest are ignored)
+        by_group = {}
+        for package in packages:
+            by_group.setdefault(self.groups.find(package.id), []).append(package)
+        groups = {member.id: members for members in by_group.values() if len(members) > 1 for member in members}
+
+        # sorts packages by their constraints (parsed from the notes at ingest)
+        for package in packages:
+            constraint = package.constraint
+            if package.id in placed:
+                continue
+
+            # if needs to be delivered along with other packages (same truck), the group is placed at its
+            # tightest deadline, as one unit of its combined size
+            if package.id in groups:
+                members = groups[package.id]
+                truck = self.group_truck(members, loads)
+                for member in members:
+                    place(member, truck)
+                continue
+
+            # if must be from a specific truck, delivered later due to a wrong address or is delayed
+            if (constraint.pinned_truck is not None or constraint.corrected_at is not None
+                    or constraint.available_after is not None):
+                place(package, self.group_truck([package], loads))
+
+        # addresses and zips each truck already visits
+        truck_locales = {truck: set() for truck in self.trucks}
+        for truck, anchored in anchors.items():
+            for package in anchored:
+                truck_locales[truck].add(package.street)
+                truck_locales[truck].add(package.zip)
+
+        # assign packages with a deadline to a truck going to the same address or zip
+        remaining = [package for package in packages if package.id not in placed]
+        for package in remaining:
+            if package.deadline_seconds != self.end_of_day:
+                for truck in self.trucks:
+                    locales = truck_locales[truck]
+                    if ((package.street in locales or package.zip in locales)
+                            and len(loads[truck]) < self.capacity):
+                        place(package, truck)
+                        break
+
+        # the rest of them go on the first truck (in priority order) with room
+        for package in remaining:
+            if package.deadline_seconds != self.end_of_day and package.id not in placed:
+                place(package, self.group_truck([package], loads))
+
+        # match by address, then by zip, against the packages placed so far
+        for key in ("street", "zip"):
+            index = {}
+            for package in remaining:
+                if package.id not in placed:
+                    index.setdefault(getattr(package, key), deque()).append(package)
+
+            for truck in self.trucks:
+                for anchor in anchors[truck]:
+                    bucket = index.get(getattr(anchor, key))
+                    while bucket and len(loads[truck]) < self.capacity:
+                        package = bucket.popleft()
+                        if package.id not in placed:
+                            place(package, truck, anchor=False)
+
+        # load remaining packages on the truck with the fewest packages
+        sizes = [(len(load), number, truck) for number, (truck, load) in enumerate(loads.items())]
+        heapq.heapify(sizes)
+        for package in remaining:
+            if package.id in placed:
+                continue
+            size, number, truck = heapq.heappop(sizes)
+            if size >= self.capacity:
+                raise IndexError('Trucks are at max capacity')
+            place(package, truck, anchor=False)
+            heapq.heappush(sizes, (size + 1, number, truck))
+
+        return loads
+
+    def delayed_truck(self, available_after):
+        """
+        O(1) - Truck for a package that reaches the hub late (seconds since midnight)
+        - The first, second or third truck, or the last one of a smaller fleet
+        """
+        if available_after < 9 * 3600:
+            wave = 0
+        elif available_after < 10 * 3600 + 20 * 60:
+            wave = 1
+        else:
+            wave = 2
+        return self.trucks[min(wave, len(self.trucks) - 1)]
+
+    def group_truck(self, members, loads):
+        """
+        O(k + t) - Truck for a package or a co-delivery group, chosen by the members' combined constraints
+        - A pinned member decides the truck
+        - Otherwise a wrong address or the latest delay decides the earliest truck that can take them,
+          and they go on it or a later one (in priority order) with room for all of them
+        - Otherwise the first truck (in priority order) with room for all of them
+        - Raises IndexError when no allowed truck has room
+
+        returns truck number
+        """
+        pinned = {member.constraint.pinned_truck for member in members} - {None}
+        if len(pinned) > 1:
+            raise ValueError(f'Packages {sorted(member.id for member in members)} must share a truck '
+                             f'but are pinned to trucks {sorted(pinned)}')
+        available = [member.constraint.available_after for member in members
+                     if member.constraint.available_after is not None]
+
+        if pinned:
+            choices = list(pinned)
+        elif any(member.constraint.corrected_at is not None for member in members):
+            choices = self.trucks[min(2, len(self.trucks) - 1):]
+        elif available:
+            choices = self.trucks[self.trucks.index(self.delayed_truck(max(available))):]
+        else:
+            choices = self.trucks
+
+        for truck in choices:
+            if len(loads[truck]) + len(members) <= self.capacity:
+                return truck
+        raise IndexError('Trucks are at max capacity')
@@ -1,33 +1,155 @@
-from datetime import datetime
+from datetime import datetime, timedelta
+
+from Constraint import Constraint
+from Timeline import seconds
+
+# placeholder dispatch and delivery time until the package is routed (shared, datetimes are immutable)
+MIDNIGHT = datetime(1900, 1, 1)
+
+
+class AddressTable:
+    """
+    Shared table of distinct addresses, packages keep the index of their address instead of their own copy
+    """
+    __slots__ = ('rows', 'index')
+    FIELDS = ('address', 'city', 'state', 'zip')
+
+    def __init__(self):
+        """
+        O(1) - Initializing the table
+        - rows: List of (address, city, state, zip) tuples, the position is the address id
+        - index: Dictionary of row -> address id
+        """
+        self.rows = []
+        self.index = {}
+
+    def __len__(self):
+        """
+        O(1) - Number of distinct addresses
+        """
+        return len(self.rows)
+
+    def intern(self, address, city, state, zip_code):
+        """
+        O(1) - Address id of an address, added to the table the first time it is seen
+
+        returns Integer
+        """
+        row = (address, city, state, zip_code)
+        address_id = self.index.get(row)
+        if address_id is None:
+            address_id = self.index[row] = len(self.rows)
+            self.rows.append(row)
+        return address_id
 
 
 class Package:
     """
     Package class
+    - Slotted record: the address is an id into the shared address table, times are integer seconds
+      since midnight, and the special note is parsed once into a Constraint
+    - address, deadline, dispatch_time and delivery_time are still readable (and the times settable)
+      as a dictionary and datetimes
     """
+    __slots__ = ('id', 'address_id', 'location_id', 'deadline_seconds', 'weight', 'notes', 'constraint', 'truck',
+                 'status', 'dispatch_seconds', 'delivery_seconds')
+    # distinct addresses of every package
+    addresses = AddressTable()
+    # right address of the "Wrong address listed" package, known once its correction comes in (Constraint.corrected_at)
+    CORRECTED_ADDRESS = ('410 S State St', 'Salt Lake City', 'UT', '84111')
 
-    def __init__(self, id, address, deadline, weight, notes, truck=None):
+    def __init__(self, id, address, deadline, weight, notes, truck=None, location_id=None):
         """
         O(1) - Initialize the package object
+        - address: Dictionary (address, city, state, zip) or address id from Package.addresses
+        - deadline: datetime or seconds since midnight
         """
         self.id = id
-        self.address = address
-        self.deadline = deadline
+        if isinstance(address, dict):
+            address = Package.addresses.intern(*(address[field] for field in AddressTable.FIELDS))
+        self.address_id = address
+        self.location_id = location_id
+        self.deadline_seconds = round(seconds(deadline))
         self.weight = weight
         self.notes = notes
+        self.constraint = Constraint.parse(notes) if notes else Constraint.NONE
         self.truck = truck
         self.status = "At the hub"
-        self.dispatch_time = datetime.strptime("00:00", "%H:%M")
-        self.delivery_time = datetime.strptime("00:00", "%H:%M")
+        self.dispatch_seconds = 0
+        self.delivery_seconds = 0
 
     def __str__(self):
         """
         O(1) - Return a string representation of the Package object
         """
+        address, city, state, zip_code = Package.addresses.rows[self.address_id]
         return "%s, %s, %s, %s, %s, %s, %s %s, %s, %s" % (
-            self.package_id, self.address, self.city, self.state, self.zip_code,
+            self.id, address, city, state, zip_code,
             self.weight, self.deadline, self.notes, self.status, self.delivery_time)
 
+    @property
+    def address(self):
+        """
+        O(1) - Address fields as a new dictionary (address, city, state, zip)
+        """
+        return dict(zip(AddressTable.FIELDS, Package.addresses.rows[self.address_id]))
+
+    @property
+    def street(self):
+        """
+        O(1) - First line of the address
+        """
+        return Package.addresses.rows[self.address_id][0]
+
+    @property
+    def zip(self):
+        """
+        O(1) - Zip code of the address
+        """
+        return Package.addresses.rows[self.address_id][3]
+
+    @property
+    def deadline(self):
+        """
+        O(1) - The deadline as a datetime (kept as deadline_seconds)
+        """
+        return MIDNIGHT + timedelta(seconds=self.deadline_seconds)
+
+    @deadline.setter
+    def deadline(self, moment):
+        """
+        O(1) - Sets the deadline from a datetime, time or seconds since midnight
+        """
+        self.deadline_seconds = round(seconds(moment))
+
+    @property
+    def dispatch_time(self):
+        """
+        O(1) - The time the package left the hub as a datetime (kept as dispatch_seconds)
+        """
+        return MIDNIGHT + timedelta(seconds=self.dispatch_seconds)
+
+    @dispatch_time.setter
+    def dispatch_time(self, moment):
+        """
+        O(1) - Sets the time the package left the hub from a datetime, time or seconds since midnight
+        """
+        self.dispatch_seconds = round(seconds(moment))
+
+    @property
+    def delivery_time(self):
+        """
+        O(1) - The time the package is (or will be) delivered as a datetime (kept as delivery_seconds)
+        """
+        return MIDNIGHT + timedelta(seconds=self.delivery_seconds)
+
+    @delivery_time.setter
+    def delivery_time(self, moment):
+        """
+        O(1) - Sets the time the package is (or will be) delivered from a datetime, time or seconds since midnight
+        """
+        self.delivery_seconds = round(seconds(moment))
+
     def assign_truck(self, truck):
         """
         O(1) - Assigns truck to the package
@@ -47,13 +169,3 @@ class Package:
         O(1) - Updates status of the package
         """
         self.status = status
-
-    def update_wrong_address(self):
-        """
-        O(1) - Fixes address for a package
-        - Specific case - Simulation for package.id == 9
-        """
-        self.address["address"] = '410 S State St'
-        self.address["city"] = 'Salt Lake City'
-        self.address["state"] = 'UT'
-        self.address["zip"] = '84111'
@@ -1,92 +1,140 @@
-from datetime import time
+# marks a slot whose package was removed, so probe chains running through it stay intact
+_DELETED = object()
 
 
 class PackageHt:
     """
     Package hash table that stores the package objects
+    - Open addressing over two parallel arrays (package ids and packages)
+    - Collisions probe with a perturbed sequence (the same recurrence CPython's dict uses)
     """
-    load_factor = 1.5
-    packages = 0
+    __slots__ = ('size', 'keys', 'values', 'package_count', 'filled')
+    load_factor = 0.7
 
-    def __init__(self, size=40, package_count=0):
+    def __init__(self, size=40):
         """
-        O(1) - Inititalizes the hash table with 40 empty buckets
+        O(n) - Inititalizes the hash table with room for at least size packages
+        - size: Integer, minimum number of packages to hold, the table gets the smallest power of two
+          of slots (at least 8) that keeps them under the load factor
+        - self.size: Integer, that number of slots
+        - keys / values: Lists, package id and package object in the same slot
+        - package_count: Integer, number of packages stored
+        - filled: Integer, slots holding a package or a removed marker
         """
-        self.size = size
-        self.table = [[] for _ in range(self.size)]
-        self.package_count = package_count
+        capacity = 8
+        while capacity * PackageHt.load_factor < size:
+            capacity *= 2
+        self.size = capacity
+        self.keys = [None] * capacity
+        self.values = [None] * capacity
+        self.package_count = 0
+        self.filled = 0
 
-    def get_package_bucket(self, package_id):
+    def __len__(self):
         """
-        O(1) - Gets the hash of the package using the package id
+        O(1) - Number of packages in the hash table
         """
-        i = hash(package_id) % self.size
-        bucket = self.table[i]
-        return bucket
+        return self.package_count
 
-    def insert(self, package_id, package_data):
+    def __contains__(self, package_id):
         """
-        O(n) - Insert/update a package using the package id and the package list
+        O(1) - Checks if a package id is in the hash table
         """
-        bucket = self.get_package_bucket(package_id)
-        package_info = [package_id, package_data]
+        return self.get_package_slot(package_id)[1]
 
-        if bucket in self.table:
-            for package in bucket:
-                if package[0] == package_id:
-                    package[1] = package_data
-                    return True
+    def __iter__(self):
+        """
+        O(n) - Iterates over the stored packages
+        """
+        for key, package in zip(self.keys, self.values):
+            if key is not None and key is not _DELETED:
+                yield package
 
-            bucket.append(package_info)
-            return True
+    def items(self):
+        """
+        O(n) - Iterates over (package id, package) pairs
+        """
+        for key, package in zip(self.keys, self.values):
+            if key is not None and key is not _DELETED:
+                yield key, package
 
-        self.package_count += 1
-        load = self.package_count / self.size
-        if load > PackageHt.load_factor:
+    def get_package_slot(self, package_id):
+        """
+        O(1) - Probes for the package id
+
+        returns the slot index and whether the package is there (if not, the slot to insert it in)
+        """
+        keys = self.keys
+        mask = self.size - 1
+        perturb = hash(package_id) & 0xFFFFFFFFFFFFFFFF
+        i = perturb & mask
+        free = -1
+
+        while True:
+            key = keys[i]
+            if key is None:
+                return (i if free < 0 else free), False
+            if key is _DELETED:
+                if free < 0:
+                    free = i
+            elif key == package_id:
+                return i, True
+            perturb >>= 5
+            i = (i * 5 + perturb + 1) & mask
+
+    def insert(self, package_id, package_data):
+        """
+        O(1) amortized - Insert/update a package using the package id and the package object
+        """
+        i, found = self.get_package_slot(package_id)
+        if not found:
+            if self.keys[i] is None:
+                self.filled += 1
+            self.keys[i] = package_id
+            self.package_count += 1
+        self.values[i] = package_data
+
+        if self.filled > self.size * PackageHt.load_factor:
             self.resize()
+        return True
 
     def lookup(self, package_id):
         """
-        O(n) - Find a package using the package_id
+        O(1) - Find a package using the package_id
+
+        returns the package, or None if there is no package with that id
         """
-        try:
-            bucket = self.get_package_bucket(package_id)
-            if bucket in self.table:
-                for package in bucket:
-                    if package[0] == package_id:
-                        return package[1]
-        except Exception:
-            raise LookupError(f"Package not found, id: {package_id}")
+        i, found = self.get_package_slot(package_id)
+        return self.values[i] if found else None
 
-    def resize(self):
+    def remove(self, package_id):
         """
-        O(n^2) - Resizing the hash table to fit the package size and copy over the existing values
+        O(1) - Removes a package using the package_id
+
+        returns boolean if the package was removed
         """
-        tmp_packages = self.table.copy()
+        i, found = self.get_package_slot(package_id)
+        if not found:
+            return False
+        self.keys[i] = _DELETED
+        self.values[i] = None
+        self.package_count -= 1
+        return True
 
-        # create an empty hash table and double the size
-        new_table = PackageHt(self.size * 2, self.package_count)
-        self = new_table
+    def resize(self):
+        """
+        O(n) - Resizing the hash table to fit the package count and copy over the existing packages
+        - Removed markers are dropped, so the new table only holds live packages
+        """
+        live = list(self.items())
+        capacity = self.size
+        while capacity * PackageHt.load_factor < 2 * len(live):
+            capacity *= 2
 
-        for package_id, package_data in tmp_packages:
+        self.size = capacity
+        self.keys = [None] * capacity
+        self.values = [None] * capacity
+        self.package_count = 0
+        self.filled = 0
+        for package_id, package_data in live:
             self.insert(package_id, package_data)
-
-    def update_all_statuses(self, custom_time):
-        """
-        O(n) - Updates the status of each package at a certain time
-        """
-        for i in range(1, self.size + 1):
-            package = self.lookup(i)
-            if not package:
-                continue
-            # special case package with id 9, needs to be updated with the right address
-            if custom_time >= time(10, 20):
-                if package.id == 9:
-                    # updates wrong address
-                    package.update_wrong_address()
-            if custom_time < package.dispatch_time.time():
-                package.update_status("At the hub")
-            elif package.dispatch_time.time() <= custom_time < package.delivery_time.time():
-                package.update_status("En route")
-            elif custom_time >= package.delivery_time.time():
-                package.update_status("Delivered")
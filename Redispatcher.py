@@ -0,0 +1,352 @@
+import time
+
+from Constraint import Constraint
+from DeliveryGroups import DeliveryGroups
+from local_search import LazyNeighbors, improve_route
+from Package import Package
+from Timeline import seconds
+from time_windows import best_insertion
+
+
+class RedispatchChange:
+    """
+    One mid-day change applied to the fleet
+    """
+
+    def __init__(self, kind, package_ids, truck_id, removed, inserted, delta, late, elapsed):
+        """
+        O(1) - Initializing the change
+        - kind: String, 'address', 'add', 'cancel' or 'delay'
+        - package_ids: List of the packages the change moved or updated
+        - truck_id: Integer, truck whose route now holds the packages (the truck they left for a cancellation)
+        - removed / inserted: Lists of location ids taken out of or put into routes
+        - delta: Float, change in the fleet's total miles
+        - late: List of package ids that are late anywhere in the fleet afterwards
+        - elapsed: Float, seconds the change took
+        """
+        self.kind = kind
+        self.package_ids = package_ids
+        self.truck_id = truck_id
+        self.removed = removed
+        self.inserted = inserted
+        self.delta = delta
+        self.late = late
+        self.elapsed = elapsed
+
+    def __str__(self):
+        late = f', late packages {self.late}' if self.late else ''
+        return (f'{self.kind}: packages {self.package_ids} truck {self.truck_id}, stops -{self.removed} '
+                f'+{self.inserted} ({self.delta:+.1f} miles{late}, {self.elapsed * 1000:.2f} ms)')
+
+
+class Redispatcher:
+    """
+    Mid-day changes to a dispatched fleet without running dispatch again
+    - The part of a route already driven, and the stop the truck is driving to, are frozen at the time of the change
+    - A change removes or inserts only the stops it affects, each inserted at the cheapest position that keeps
+      the deadlines (O(1) slack checks, see RouteTimes.insertion), then improve_route repairs the rest of the
+      route around them
+    - Delivery times and the timeline are refreshed by walking each truck's route once, no search is rerun
+    """
+
+    def __init__(self, trucks, distances, package_table, timeline=None):
+        """
+        O(1) - Initializing the redispatcher
+        - trucks: List of dispatched trucks (the third one waits for the first one's driver, see Truck.on_time)
+        - package_table: PackageHt of the dispatched packages
+        - timeline: Timeline to keep up to date, None if there is none
+        """
+        self.trucks = trucks
+        self.distances = distances
+        self.package_table = package_table
+        self.timeline = timeline
+
+    def correct_address(self, package_id, address, moment):
+        """
+        O(n * k^2) - Moves an undelivered package to its corrected address on the truck it is on
+        - address: Tuple (address, city, state, zip), the street must be in the distance table
+
+        returns RedispatchChange
+        """
+        start = time.perf_counter()
+        parcel, truck, arrivals = self._undelivered(package_id, moment)
+        location_id = self.distances.location_id(address[0])
+        before = self._miles()
+
+        old_location = parcel.location_id
+        parcel.address_id = Package.addresses.intern(*address)
+        parcel.location_id = location_id
+        removed = self._unused([old_location], truck)
+        self._edit(truck, moment, removed, [location_id], arrivals)
+        return self._change('address', [parcel], truck, removed, [location_id], before, start, moment)
+
+    def add_package(self, parcel, moment):
+        """
+        O(t * n + n * k^2) - Loads a new package on the truck at the hub where it is cheapest to deliver
+        - The package's location is resolved from its street when it has none
+        - It can only go on a truck that has not left by the time the package is available, and with the
+          rest of its co-delivery group if it has one
+
+        returns RedispatchChange
+        """
+        start = time.perf_counter()
+        if parcel.location_id is None:
+            parcel.location_id = self.distances.location_id(parcel.street)
+        if self.package_table.lookup(parcel.id) is not None:
+            raise ValueError(f'Package {parcel.id} is already dispatched')
+        before = self._miles()
+
+        truck = self._place([parcel], seconds(moment), None)
+        self.package_table.insert(parcel.id, parcel)
+        return self._change('add', [parcel], truck, [], [parcel.location_id], before, start, moment)
+
+    def cancel_package(self, package_id, moment):
+        """
+        O(n * k^2) - Takes an undelivered package off its truck and out of the package table
+
+        returns RedispatchChange
+        """
+        start = time.perf_counter()
+        parcel, truck, arrivals = self._undelivered(package_id, moment)
+        before = self._miles()
+
+        truck.unassign_package(parcel)
+        removed = self._unused([parcel.location_id], truck)
+        self._edit(truck, moment, removed, [], arrivals)
+        self.package_table.remove(package_id)
+        if self.timeline is not None:
+            self.timeline.packages.pop(package_id, None)
+        return self._change('cancel', [parcel], truck, removed, [], before, start, moment)
+
+    def delay_package(self, package_id, available_after, moment):
+        """
+        O(t * n + n * k^2) - A package still at the hub will only be available later
+        - If its truck leaves before then, the package (with its co-delivery group) moves to a truck that leaves
+          after it is available
+
+        returns RedispatchChange
+        """
+        start = time.perf_counter()
+        parcel, truck, arrivals = self._undelivered(package_id, moment)
+        moment = seconds(moment)
+        available_after = seconds(available_after)
+        if seconds(truck.departure_time) <= moment:
+            raise ValueError(f'Package {package_id} already left the hub on truck {truck.id}')
+        before = self._miles()
+
+        constraint = parcel.constraint
+        parcel.constraint = Constraint(constraint.pinned_truck, available_after, constraint.group,
+                                       constraint.corrected_at)
+        if seconds(truck.departure_time) >= available_after:
+            return self._change('delay', [parcel], truck, [], [], before, start, moment)
+
+        groups = DeliveryGroups(member for other in self.trucks for member in other.packages)
+        group = groups.find(parcel.id)
+        parcels = [member for member in truck.packages if groups.find(member.id) == group]
+        for member in parcels:
+            truck.unassign_package(member)
+        removed = self._unused([member.location_id for member in parcels], truck)
+        route = list(truck.route)
+        self._edit(truck, moment, removed, [], arrivals)
+        try:
+            target = self._place(parcels, max(moment, available_after), truck)
+        except ValueError:
+            # no truck can take them, everything stays as it was
+            parcel.constraint = constraint
+            for member in parcels:
+                truck.assign_package(member)
+            truck.route = route
+            truck.total_distance = self.distances.route_length(route)
+            raise
+        return self._change('delay', parcels, target, removed, list(dict.fromkeys(
+            member.location_id for member in parcels)), before, start, moment)
+
+    def _undelivered(self, package_id, moment):
+        """
+        O(n) - A package, its truck and the truck's arrival times (see _arrivals), if it has not been delivered yet
+
+        returns the package, the truck and the arrivals
+        """
+        parcel = self.package_table.lookup(package_id)
+        if parcel is None:
+            raise LookupError(f'No package with id {package_id}')
+        truck = parcel.truck
+        if truck is None or truck not in self.trucks:
+            raise ValueError(f'Package {package_id} is not on a truck')
+        arrivals = self._arrivals(truck)
+        if any(arrival <= seconds(moment) for location, arrival in zip(truck.route, arrivals)
+               if location == parcel.location_id):
+            raise ValueError(f'Package {package_id} was already delivered')
+        return parcel, truck, arrivals
+
+    def _arrivals(self, truck):
+        """
+        O(n) - Seconds since midnight the truck reaches each position of its route (the departure for the first),
+        timed like RouteTimes.arrival
+        """
+        speed = truck.mph / 3600
+        time = seconds(truck.departure_time)
+        arrivals = [time]
+        for current_location, next_location in zip(truck.route, truck.route[1:]):
+            time += self.distances.d(current_location, next_location) / speed
+            arrivals.append(time)
+        return arrivals
+
+    def _frozen(self, truck, moment, arrivals=None):
+        """
+        O(n) - Number of route positions that can no longer change: the stops reached and the one being driven to
+        (only the hub before the truck leaves)
+        - arrivals: the truck's arrival times when the caller already has them (see _arrivals)
+
+        returns the count and the arrival time at the last frozen position
+        """
+        if arrivals is None:
+            arrivals = self._arrivals(truck)
+        moment = seconds(moment)
+        if moment < arrivals[0]:
+            return 1, arrivals[0]
+        for p, arrival in enumerate(arrivals):
+            if arrival > moment:
+                return p + 1, arrival
+        return len(arrivals), arrivals[-1]
+
+    def _unused(self, locations, truck):
+        """
+        O(n) - The locations no package on the truck goes to anymore
+        """
+        used = {parcel.location_id for parcel in truck.packages}
+        return [location for location in dict.fromkeys(locations) if location not in used]
+
+    def _edit(self, truck, moment, removed, inserted, arrivals=None):
+        """
+        O(n * k^2) - Removes and inserts stops after the frozen part of a truck's route, then repairs it
+        - Removed stops that are frozen stay (the truck just drives past), inserted stops already ahead are skipped
+        - Inserted stops go in tightest deadline first, at the cheapest position that keeps every deadline,
+          or the cheapest position overall when none does
+        - arrivals: the truck's arrival times when the caller already has them (see _arrivals)
+        """
+        route = truck.route
+        frozen, anchor_arrival = self._frozen(truck, moment, arrivals)
+        if not route:
+            route = [self.distances.location_id(truck.hub_address)]
+            frozen = 1
+        closed = len(route) > 1 and route[-1] == route[0]
+        # the truck is driving back to the hub, or has finished an open route
+        if frozen == len(route) and len(route) > 1 and (closed or seconds(moment) >= anchor_arrival):
+            if any(location != route[-1] for location in inserted):
+                raise ValueError(f'Truck {truck.id} has finished its route')
+            return
+
+        prefix, path = route[:frozen], route[frozen - 1:]
+        touched = []
+        for location in removed:
+            if location in path[1:]:
+                p = path.index(location)
+                touched += [path[p - 1], path[p + 1] if p + 1 < len(path) else None]
+                path.pop(p)
+
+        # deadlines of the packages still to deliver, timed from the stop the truck is at (or driving to)
+        reached = set(route[:frozen - 1])
+        windows = truck.time_windows([parcel for parcel in truck.packages if parcel.location_id not in reached])
+        windows.departure = anchor_arrival
+        for location in sorted(dict.fromkeys(inserted), key=windows.deadline):
+            if location in path:
+                continue
+            _, p, _ = best_insertion(path, location, windows.route_times(path, self.distances), closed)
+            path.insert(p + 1, location)
+            touched.append(location)
+
+        # only the stops near the change are examined, so only their neighbor lists are found
+        neighbors = LazyNeighbors(self.distances, tuple(sorted(set(path))))
+        path = improve_route(path, self.distances, neighbors, windows,
+                             [location for location in touched if location is not None], closed)
+        truck.route = prefix + path[1:]
+        truck.total_distance = self.distances.route_length(truck.route)
+        truck.timeline = None
+
+    def _place(self, parcels, available, leaving):
+        """
+        O(t * n + n * k^2) - Puts packages (one co-delivery group) on the truck at the hub where their stops
+        are cheapest to insert
+        - A truck qualifies if it leaves at or after available, every package is allowed on it (see Constraint.allows),
+          it has room for all of them and it holds the rest of their group, if any is dispatched
+        - Trucks where the stops keep every deadline are preferred
+
+        returns the truck
+        """
+        ids = {parcel.id for parcel in parcels}
+        group = set()
+        for parcel in parcels:
+            group.update(parcel.constraint.group)
+        group -= ids
+        locations = list(dict.fromkeys(parcel.location_id for parcel in parcels))
+
+        best = None
+        for truck in self.trucks:
+            if truck is leaving:
+                continue
+            departure = seconds(truck.departure_time)
+            if departure < available or len(truck.packages) + len(parcels) > truck.max_capacity:
+                continue
+            if not all(parcel.constraint.allows(truck.id, departure) for parcel in parcels):
+                continue
+            others = {parcel.id for parcel in truck.packages}
+            if group and any(self.package_table.lookup(member) is not None and member not in others
+                             for member in group):
+                continue
+
+            # O(n) per stop - cheapest insertion estimate, on time if every stop fits a gap that keeps the deadlines
+            route = truck.route or [self.distances.location_id(truck.hub_address)]
+            windows = truck.time_windows(truck.packages + parcels)
+            times = windows.route_times(route, self.distances)
+            closed = len(route) > 1 and route[-1] == route[0]
+            cost, on_time = 0.0, times.feasible()
+            for location in locations:
+                if location in route:
+                    continue
+                added, _, kept = best_insertion(route, location, times, closed)
+                cost += added
+                on_time = on_time and kept
+            if best is None or (not on_time, cost) < best[0]:
+                best = ((not on_time, cost), truck)
+
+        if best is None:
+            raise ValueError(f'No truck at the hub can take packages {sorted(ids)}')
+        truck = best[1]
+        for parcel in parcels:
+            truck.assign_package(parcel)
+            parcel.truck = truck
+            parcel.dispatch_seconds = round(seconds(truck.departure_time))
+        self._edit(truck, available, [], locations)
+        return truck
+
+    def _miles(self):
+        """
+        O(t) - Total miles of the fleet's routes
+        """
+        return sum(self.distances.route_length(truck.route) for truck in self.trucks)
+
+    def _change(self, kind, parcels, truck, removed, inserted, before, start, moment):
+        """
+        O(t * n) - Refreshes every truck's delivery times and timeline, then records the change
+        - Every truck, since the third one's departure waits for the first one's driver (see Truck.on_time),
+          unless the third truck already left the hub by the time of the change
+        - Only the trucks whose route (see _edit) or departure changed are re-added to the timeline
+
+        returns RedispatchChange
+        """
+        truck3 = self.trucks[2] if len(self.trucks) > 2 else self.trucks[-1]
+        if seconds(truck3.departure_time) <= seconds(moment):
+            truck3 = None
+        late = []
+        departures = [other.departure_time for other in self.trucks]
+        # in truck order, so the first truck's return moves the third truck's departure before it is timed
+        for other in self.trucks:
+            other.on_time(self.distances, truck3)
+        for other, departure in zip(self.trucks, departures):
+            if self.timeline is not None and (other.timeline is not self.timeline
+                                              or other.departure_time != departure):
+                self.timeline.add_truck(other, self.distances)
+            late += [parcel.id for parcel in other.packages if parcel.delivery_seconds > parcel.deadline_seconds]
+        return RedispatchChange(kind, [parcel.id for parcel in parcels], truck.id, removed, inserted,
+                                self._miles() - before, sorted(late), time.perf_counter() - start)
@@ -0,0 +1,104 @@
+from collections import OrderedDict
+import hashlib
+import json
+import os
+
+
+class RouteCache:
+    """
+    Best known route for each stop set, so repeated dispatches warm-start instead of starting cold
+    - Keyed by a fingerprint of (stop set, start location, closed route, time windows, distance matrix version)
+    - Least recently used entries are evicted past the size cap
+    - Optionally saved to and loaded from a JSON file between runs
+    """
+    FORMAT = 1
+
+    def __init__(self, capacity=1024, path=None):
+        """
+        O(1) - Initializing the cache (and O(n) loading it when the file exists)
+        - capacity: Integer, most entries kept
+        - path: String, JSON file the cache is loaded from and saved to, None to keep it in memory
+        - entries: OrderedDict of fingerprint -> (route, distance), least recently used first
+        - hits / misses: Integers, lookups that found or missed an entry
+        """
+        self.capacity = capacity
+        self.path = path
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        if path is not None and os.path.exists(path):
+            self.load()
+
+    def __len__(self):
+        """
+        O(1) - Number of cached routes
+        """
+        return len(self.entries)
+
+    @staticmethod
+    def key(stops, start_location, closed, distances, windows=None):
+        """
+        O(n log n) - Canonical fingerprint of a routing problem, independent of the order of the stops
+        - Deadlines, departure and speed are part of the key when the search uses time windows
+
+        returns hex digest string
+        """
+        parts = [distances.version(), start_location, bool(closed), sorted(set(stops))]
+        if windows is not None:
+            parts.append([sorted(windows.deadlines.items()), windows.departure, windows.mph])
+        return hashlib.sha1(json.dumps(parts, separators=(',', ':')).encode()).hexdigest()
+
+    def get(self, key):
+        """
+        O(1) - Best known route for a fingerprint, marked as recently used
+
+        returns (route, distance) or None
+        """
+        entry = self.entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self.entries.move_to_end(key)
+        return entry
+
+    def put(self, key, route, distance):
+        """
+        O(1) - Stores a route unless a shorter one is already known, evicting the least recently used entry
+
+        returns boolean if the route was stored
+        """
+        entry = self.entries.get(key)
+        if entry is not None and entry[1] <= distance:
+            self.entries.move_to_end(key)
+            return False
+        self.entries[key] = (list(route), distance)
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.capacity:
+            self.entries.popitem(last=False)
+        return True
+
+    def load(self):
+        """
+        O(n) - Replaces the entries with the ones saved at path, ignoring files of another format
+        """
+        with open(self.path) as cache_file:
+            data = json.load(cache_file)
+        if data.get('format') != RouteCache.FORMAT:
+            return
+        self.entries.clear()
+        for key, route, distance in data['entries'][-self.capacity:]:
+            self.entries[key] = (route, distance)
+
+    def save(self):
+        """
+        O(n) - Writes the entries to path, least recently used first (written to a temporary file, then renamed)
+        """
+        if self.path is None:
+            return
+        temporary = self.path + '.tmp'
+        with open(temporary, 'w') as cache_file:
+            json.dump({'format': RouteCache.FORMAT,
+                       'entries': [[key, route, distance] for key, (route, distance) in self.entries.items()]},
+                      cache_file, separators=(',', ':'))
+        os.replace(temporary, self.path)
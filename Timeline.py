@@ -0,0 +1,122 @@
+from bisect import bisect_right
+import datetime
+
+
+def seconds(moment):
+    """
+    O(1) - Seconds since midnight of a time or datetime (numbers are already seconds and are passed through)
+    """
+    if isinstance(moment, (int, float)):
+        return moment
+    if isinstance(moment, datetime.datetime):
+        moment = moment.time()
+    return moment.hour * 3600 + moment.minute * 60 + moment.second + moment.microsecond / 1e6
+
+
+class Timeline:
+    """
+    Sorted delivery events per truck and per package, built once after dispatch
+    - Every "state at time T" query is a bisect over these events
+    """
+    DEPART = 'Depart'
+    ARRIVE = 'Arrive'
+    DELIVER = 'Deliver'
+    RETURN = 'Return to hub'
+
+    def __init__(self):
+        """
+        O(1) - Initializing the timeline
+        - trucks: Dictionary of truck id -> (event times, events, mph)
+        - packages: Dictionary of package id -> (event times, events)
+
+        Times are seconds since midnight, events are (kind, location id, truck miles, package or truck id)
+        """
+        self.trucks = {}
+        self.packages = {}
+
+    def build(self, trucks, distances):
+        """
+        O(n) - Replaces the timeline with the events of the given trucks
+        """
+        self.trucks.clear()
+        self.packages.clear()
+        for truck in trucks:
+            self.add_truck(truck, distances)
+
+    def add_truck(self, truck, distances):
+        """
+        O(n) - Walks the truck route once, recording depart, arrive, deliver and return events
+        """
+        time = seconds(truck.departure_time)
+        hub = truck.route[0] if truck.route else 0
+        miles = 0.0
+        times = [time]
+        events = [(Timeline.DEPART, hub, miles, None)]
+
+        parcels_at = {}
+        for parcel in truck.packages:
+            parcels_at.setdefault(parcel.location_id, []).append(parcel)
+            self.packages[parcel.id] = ([time], [(Timeline.DEPART, hub, miles, truck.id)])
+
+        for current_location, next_location in zip(truck.route, truck.route[1:]):
+            distance = distances.d(current_location, next_location)
+            time += distance / truck.mph * 3600
+            miles += distance
+            kind = Timeline.RETURN if next_location == hub else Timeline.ARRIVE
+            times.append(time)
+            events.append((kind, next_location, miles, None))
+
+            for parcel in parcels_at.pop(next_location, ()):
+                times.append(time)
+                events.append((Timeline.DELIVER, next_location, miles, parcel.id))
+                package_times, package_events = self.packages[parcel.id]
+                package_times.append(time)
+                package_events.append((Timeline.DELIVER, next_location, miles, truck.id))
+
+        self.trucks[truck.id] = (times, events, truck.mph)
+        truck.timeline = self
+
+    def truck_at(self, truck_id, moment):
+        """
+        O(log n) - Latest location and miles traveled by a truck at a time (or the previous stop if en route)
+
+        returns location and miles
+        """
+        times, events, mph = self.trucks[truck_id]
+        time = seconds(moment)
+        i = bisect_right(times, time) - 1
+
+        # not departed yet
+        if i < 0:
+            return events[0][1], 0.0
+
+        _, location, miles, _ = events[i]
+        # en route to the next stop
+        if i + 1 < len(times):
+            miles += mph * (time - times[i]) / 3600
+        return location, miles
+
+    def package_status(self, package_id, moment):
+        """
+        O(log n) - Status of a package at a time
+
+        returns the status string
+        """
+        times, events = self.packages[package_id]
+        i = bisect_right(times, seconds(moment)) - 1
+        if i < 0:
+            return "At the hub"
+        if events[i][0] == Timeline.DELIVER:
+            return "Delivered"
+        return "En route"
+
+    def truck_events(self, truck_id, start, end):
+        """
+        O(log n + k) - Events of a truck between two times (inclusive)
+
+        returns list of (seconds since midnight, event)
+        """
+        times, events, _ = self.trucks[truck_id]
+        first = bisect_right(times, seconds(start) - 1e-9)
+        last = bisect_right(times, seconds(end))
+        return list(zip(times[first:last], events[first:last]))
@@ -1,5 +1,8 @@
 import datetime
 from math import inf
+from Timeline import Timeline, seconds
+from time_windows import TimeWindows
+from Package import MIDNIGHT
 
 
 class Truck:
@@ -18,6 +21,7 @@ class Truck:
         - packages: List of packages assigned to the truck
         - total_mileage: Integer, total distance traveled by truck
         - route: List of Strings, route taken by truck
+        - timeline: Timeline with this truck's events, built after dispatch
         """
         self.id = id
         self.departure_time = datetime.datetime.strptime(
@@ -30,6 +34,7 @@ class Truck:
         self.total_mileage = Truck.starting_mileage
         self.total_distance = Truck.starting_distance
         self.route = []
+        self.timeline = None
 
     def is_max_capacity(self):
         """
@@ -37,7 +42,7 @@ class Truck:
 
         returns boolean if the truck is full or not
         """
-        if len(self.packages) == Truck.max_capacity:
+        if len(self.packages) >= self.max_capacity:
             return True
         return False
 
@@ -54,13 +59,16 @@ class Truck:
         if distance < self.total_distance:
             self.route = route
             self.total_distance = distance
+            self.timeline = None
 
     def assign_package(self, package):
         """
         O(1) - Assigns package to the truck
+        - Raises IndexError if the truck is full, the package would never be delivered
         """
-        if not self.is_max_capacity():
-            self.packages.append(package)
+        if self.is_max_capacity():
+            raise IndexError(f'Truck {self.id} is at max capacity, package {package.id} does not fit')
+        self.packages.append(package)
 
     def unassign_package(self, package):
         """
@@ -73,31 +81,26 @@ class Truck:
         O(n) - Calculates distance between all locations in a route
         """
 
-        distance = 0
+        return distances.route_length(route)
 
-        for i in range(len(route) - 1):
-            loc1 = route[i]
-            loc2 = route[i + 1]
-
-            if distances[loc1][loc2]:
-                distance += distances[loc1][loc2]
-            else:
-                distance += distances[loc2][loc1]
-
-        return distance
-
-    def on_time(self, distances, addresses, truck3):
+    def on_time(self, distances, truck3):
         """
-        O(n^2) - Tracks time for the truck and packages.
+        O(n) - Tracks time for the truck and packages.
         Will confirm if the packages will be delivered on time (by their deadline)
+        - truck3: the truck whose departure waits for truck 1 to be back at the hub, None when it can't wait
 
         returns boolean if the package will be on time or not
         """
 
-        current_time = self.departure_time
+        current_time = seconds(self.departure_time)
         self.miles_traveled = 0
         self.location = 0
 
+        # groups packages by location id once, so each stop only touches its own packages
+        parcels_at = {}
+        for parcel in self.packages:
+            parcels_at.setdefault(parcel.location_id, []).append(parcel)
+
         # iterates throught truck route
         for i in range(len(self.route) - 1):
             current_location = self.route[i]
@@ -105,53 +108,46 @@ class Truck:
             self.location = next_location
 
             # increments miles traveled and arrival time at each location
-            travel_distance = self.calculate_distance(
-                (current_location, next_location), distances)
+            travel_distance = distances.d(current_location, next_location)
             self.miles_traveled += travel_distance
-            time_to_location = travel_distance / self.mph
-            current_time += datetime.timedelta(hours=time_to_location)
+            time_to_location = travel_distance / self.mph * 3600
+            current_time += time_to_location
+
+            # sets the departure time (a one-truck fleet has no third truck to wait, None once it has left)
+            if (self.id == 1 and truck3 is not None and truck3 is not self and self.location == 0
+                    and current_time > seconds(truck3.departure_time)):
+                truck3.departure_time = MIDNIGHT + datetime.timedelta(seconds=current_time)
 
-            # sets the departure time
-            if self.id == 1 and self.location == 0 and current_time > truck3.departure_time:
-                truck3.departure_time = current_time
+            # updates package delivery times (whole seconds since midnight)
+            delivered = round(current_time)
+            for parcel in parcels_at.get(next_location, ()):
+                parcel.delivery_seconds = delivered
 
-            # updates package delivery times
-            for parcel in self.packages:
-                if addresses.index(parcel.address['address']) == next_location:
-                    parcel.delivery_time = current_time
+        return all(parcel.delivery_seconds <= parcel.deadline_seconds for parcel in self.packages)
 
-        return all(parcel.delivery_time <= parcel.deadline for parcel in self.packages)
+    def time_windows(self, packages=None):
+        """
+        O(n) - Deadlines of the truck's stops (earliest package deadline at each location), its departure and speed
+        - packages: optional packages to use instead of the truck's own, to check a load before assigning it
+
+        returns TimeWindows
+        """
+        deadlines = {}
+        for parcel in self.packages if packages is None else packages:
+            deadline = parcel.deadline_seconds
+            if deadline < deadlines.get(parcel.location_id, inf):
+                deadlines[parcel.location_id] = deadline
+
+        return TimeWindows(deadlines, seconds(self.departure_time), self.mph)
 
     def execute_route(self, custom_time, distances):
         """
-        O(n) - Gets the current location (or previous one if between) and miles traveled at a specific time.
+        O(log n) - Gets the current location (or previous one if between) and miles traveled at a specific time.
+        - Bisects the delivery timeline, which is built from the route once if dispatch has not built it
 
         returns location and miles
         """
-        current_time = self.departure_time
-        location = self.route[0] if self.route else 0
-        miles = 0
-
-        for current_location, next_location in zip(self.route, self.route[1:]):
-            distance = self.calculate_distance(
-                (current_location, next_location), distances)
-            travel_time = datetime.timedelta(hours=distance / self.mph)
-
-            # converts custom_time to datetime so it can compare properly
-            if not isinstance(custom_time, datetime.datetime):
-                custom_time = datetime.datetime.combine(
-                    current_time.date(), custom_time)
-
-            if current_time + travel_time > custom_time:
-                # this means truck is in between two locations (en route)
-                # Time difference in hours
-                time_diff = (custom_time - current_time).total_seconds() / 3600
-                partial_distance = self.mph * time_diff
-                miles += partial_distance
-                return current_location, miles
-
-            current_time += travel_time
-            miles += distance
-            location = next_location
-
-        return location, miles
+        if self.timeline is None or self.id not in self.timeline.trucks:
+            Timeline().add_truck(self, distances)
+
+        return self.timeline.truck_at(self.id, custom_time)
@@ -0,0 +1,316 @@
+"""
+ Benchmarks for the dispatch pipeline on synthetic instances
+
+ Generates a distance table and a package manifest in the same csv formats as the shipped files,
+ then times each pipeline stage and reports route quality and throughput. Results can be written
+ as JSON (tagged with the git commit) to compare runs across commits.
+
+ Run: python benchmark.py --packages 100 1000 10000 --stops 50 500 2000 --trucks 3 --json results.json
+"""
+from datetime import datetime
+from functools import partial
+import argparse
+import csv
+import json
+import math
+import os
+import platform
+import random
+import subprocess
+import tempfile
+import time
+
+from DispatchStats import DispatchStats
+from FleetSimulator import FleetSimulator
+import helper
+from local_search import local_search_restart
+from optimizer import optimize_route
+from PackageHt import PackageHt
+from rebalance import rebalance
+from Redispatcher import Redispatcher
+from Timeline import Timeline
+from Truck import Truck
+import vrp
+
+# share of packages with each deadline, the rest are due at end of day
+DEADLINE_MIX = (('9:00 AM', 0.05), ('10:30 AM', 0.25))
+# share of packages with each kind of special note (same wording as packages.csv)
+NOTE_MIX = (('pinned', 0.03), ('delayed', 0.05), ('wrong address', 0.01), ('delivered with', 0.03))
+DELAYS = ('8:45 am', '9:05 am', '10:20 am')
+# "delivered with" partners come from the package's own block of ids, so no co-delivery group outgrows a truckload
+GROUP_BLOCK = 8
+SEARCHES = {'local': local_search_restart, 'three_opt': helper.three_opt_restart}
+
+
+def generate_instance(packages, stops, trucks=3, seed=1):
+    """
+    O(s^2 + p) - Random synthetic instance
+    - The hub plus stops scattered over a 20 x 20 mile square, straight-line distances rounded like the real table
+    - Packages spread over the stops with the deadline and note mix above, pinned trucks are 1..trucks
+    - Co-delivery groups stay inside blocks of GROUP_BLOCK ids, and the packages of a block are pinned to one truck
+
+    returns list of addresses (hub first), list of lower-triangular distance rows and list of package rows
+    """
+    rng = random.Random(seed)
+    addresses = [Truck.hub_address] + [f'{i} Synthetic Ave' for i in range(1, stops + 1)]
+    points = [(rng.uniform(0, 20), rng.uniform(0, 20)) for _ in addresses]
+    distances = [[round(math.dist(points[i], points[j]), 1) for j in range(i + 1)] for i in range(len(points))]
+
+    package_rows = []
+    for package_id in range(1, packages + 1):
+        block = (package_id - 1) // GROUP_BLOCK
+        partners = [i for i in range(block * GROUP_BLOCK + 1, min(packages, (block + 1) * GROUP_BLOCK) + 1)
+                    if i != package_id]
+        address = addresses[rng.randint(1, stops)]
+        deadline = 'EOD'
+        roll = rng.random()
+        for value, share in DEADLINE_MIX:
+            if roll < share:
+                deadline = value
+                break
+            roll -= share
+
+        notes = ''
+        roll = rng.random()
+        for kind, share in NOTE_MIX:
+            if roll < share:
+                if kind == 'pinned':
+                    notes = f'Can only be on truck {block % trucks + 1}'
+                elif kind == 'delayed':
+                    notes = f'Delayed on flight---will not arrive to depot until {rng.choice(DELAYS)}'
+                elif kind == 'wrong address':
+                    notes = 'Wrong address listed'
+                elif len(partners) >= 2:
+                    group = rng.sample(partners, 2)
+                    notes = f'Must be delivered with {group[0]}, {group[1]}'
+                break
+            roll -= share
+
+        zip_code = str(84100 + int(address.split()[0]) % 30)
+        package_rows.append([package_id, address, 'Salt Lake City', 'UT', zip_code, deadline,
+                             rng.randint(1, 90), notes])
+
+    return addresses, distances, package_rows
+
+
+def write_instance(directory, addresses, distances, package_rows):
+    """
+    O(s^2 + p) - Writes the instance as distances.csv and packages.csv in the shipped formats
+
+    returns the distance csv path and the package csv path
+    """
+    distance_path = os.path.join(directory, 'distances.csv')
+    package_path = os.path.join(directory, 'packages.csv')
+
+    with open(distance_path, 'w', newline='') as distance_file:
+        writer = csv.writer(distance_file)
+        writer.writerow(['DISTANCE BETWEEN HUBS IN MILES', ''] +
+                        [f'Stop {i}\n {address}, \nSalt Lake City, UT' for i, address in enumerate(addresses)])
+        for i, (address, row) in enumerate(zip(addresses, distances)):
+            writer.writerow([f'Stop {i}\n {address}', f' {address}'] + row + [''] * (len(addresses) - len(row)))
+
+    with open(package_path, 'w', newline='') as package_file:
+        writer = csv.writer(package_file)
+        writer.writerow(['Package\nID', 'Address', 'City ', 'State', 'Zip', 'Delivery\nDeadline', 'Weight\nKILO',
+                         'Special Notes'])
+        writer.writerows(package_rows)
+
+    return distance_path, package_path
+
+
+def timed(function, *args):
+    """
+    O(function) - Runs a function once
+
+    returns the result and the seconds it took
+    """
+    start = time.perf_counter()
+    result = function(*args)
+    return result, time.perf_counter() - start
+
+
+def run_instance(packages, stops, trucks=3, seed=1, restarts=3, search='local', queries=10000,
+                 changes_per_instance=20):
+    """
+    Times every pipeline stage on one synthetic instance
+
+    returns dictionary of instance sizes and per-stage measurements
+    """
+    report = {'packages': packages, 'stops': stops, 'trucks': trucks, 'seed': seed, 'stages': {}}
+    stages = report['stages']
+    rng = random.Random(seed)
+
+    with tempfile.TemporaryDirectory() as directory:
+        instance, seconds = timed(generate_instance, packages, stops, trucks, seed)
+        distance_path, package_path = write_instance(directory, *instance)
+        stages['generate'] = {'seconds': seconds}
+
+        distances, seconds = timed(helper.load_distance_csv, distance_path)
+        stages['distance_csv'] = {'seconds': seconds, 'locations': len(distances)}
+
+        package_list, seconds = timed(helper.read_package_csv, package_path, distances)
+        stages['package_csv'] = {'seconds': seconds, 'packages_per_second': packages / seconds}
+
+    # hash table inserts and lookups on a fresh table
+    table = PackageHt()
+    _, insert_seconds = timed(lambda: [table.insert(parcel.id, parcel) for parcel in package_list])
+    ids = [parcel.id for parcel in package_list]
+    rng.shuffle(ids)
+    _, lookup_seconds = timed(lambda: [table.lookup(package_id) for package_id in ids])
+    stages['hash_table'] = {'seconds': insert_seconds + lookup_seconds,
+                            'inserts_per_second': packages / insert_seconds,
+                            'lookups_per_second': packages / lookup_seconds}
+
+    # the load planner fills one load per truck, so truck capacity is raised to hold the whole manifest
+    capacity = Truck.max_capacity
+    planning_capacity = Truck.max_capacity = max(capacity, packages)
+    try:
+        loads, seconds = timed(helper.sort_package_load_list, list(package_list), tuple(range(1, trucks + 1)))
+        stages['load_plan'] = {'seconds': seconds, 'packages_per_second': packages / seconds}
+    except Exception as error:
+        stages['load_plan'] = {'error': f'{type(error).__name__}: {error}'}
+        return report
+    finally:
+        Truck.max_capacity = capacity
+
+    # one truck per load, with the capacity the loads were planned for (rebalance moves are capacity bound),
+    # routes from the optimizer with a fixed number of seeded restarts
+    by_id = {parcel.id: parcel for parcel in package_list}
+    fleet = []
+    for truck_id, load in loads.items():
+        truck = Truck(truck_id, '08:00:00', truck_id)
+        truck.max_capacity = planning_capacity
+        for package_id in dict.fromkeys(load):
+            truck.packages.append(by_id[package_id])
+            by_id[package_id].assign_truck(truck)
+        fleet.append(truck)
+
+    stats = DispatchStats()
+    start = time.perf_counter()
+    total_miles = total_restarts = 0
+    for truck in fleet:
+        algorithm = partial(helper.truck_search, SEARCHES[search], stats=stats)
+        result = optimize_route(truck, distances, distances.locations, algorithm, restarts,
+                                seed=f'{seed}:{truck.id}', stats=stats)
+        truck.update_route(result.route, result.distance)
+        total_miles += result.distance
+        total_restarts += result.restarts
+    seconds = time.perf_counter() - start
+    stages['routing'] = {'seconds': seconds, 'search': search, 'total_miles': total_miles,
+                         'stops_routed': sum(len(helper.truck_stops(truck)) for truck in fleet),
+                         'restarts_per_second': total_restarts / seconds,
+                         'restarts_improved': stats.counters.get('restarts improved', 0),
+                         'candidates': stats.counters.get('route candidates', 0)}
+
+    _, seconds = timed(lambda: [truck.on_time(distances, fleet[-1]) for truck in fleet])
+    late = sum(1 for truck in fleet for parcel in truck.packages if parcel.delivery_seconds > parcel.deadline_seconds)
+    stages['on_time'] = {'seconds': seconds, 'late_packages': late}
+
+    moves, seconds = timed(partial(rebalance, stats=stats), fleet, distances, fleet[-1])
+    late = sum(1 for truck in fleet for parcel in truck.packages if parcel.delivery_seconds > parcel.deadline_seconds)
+    stages['rebalance'] = {'seconds': seconds, 'moves': len(moves),
+                           'fixed_packages': sum(len(move.fixed) for move in moves), 'late_packages': late,
+                           'moves_evaluated': stats.counters.get('rebalance moves evaluated', 0)}
+
+    timeline = Timeline()
+    _, build_seconds = timed(timeline.build, fleet, distances)
+    moments = [datetime(1900, 1, 1, rng.randint(8, 17), rng.randint(0, 59)) for _ in range(queries)]
+    package_ids = [rng.choice(list(timeline.packages)) for _ in range(queries)]
+    _, query_seconds = timed(lambda: [(timeline.truck_at(fleet[i % len(fleet)].id, moment),
+                                       timeline.package_status(package_ids[i], moment))
+                                      for i, moment in enumerate(moments)])
+    stages['timeline'] = {'seconds': build_seconds + query_seconds, 'build_seconds': build_seconds,
+                          'queries_per_second': queries / query_seconds}
+
+    # whole-fleet positions every minute of the day in one sweep
+    simulator, build_seconds = timed(FleetSimulator, fleet, distances)
+    (minutes, _), sweep_seconds = timed(simulator.playback, 8 * 3600, 17 * 3600)
+    stages['playback'] = {'seconds': build_seconds + sweep_seconds, 'build_seconds': build_seconds,
+                          'positions_per_second': len(minutes) * len(fleet) / sweep_seconds}
+
+    # multi-trip routing with hub reloads, one driver per truck working 08:00 - 17:00
+    drivers = [vrp.Driver(truck_id, '08:00:00', '17:00:00') for truck_id in range(1, trucks + 1)]
+    try:
+        plan, seconds = timed(vrp.solve, package_list, distances, drivers, list(range(1, trucks + 1)),
+                              Truck.max_capacity, Truck.avg_mph)
+        stages['vrp'] = {'seconds': seconds, 'trips': len(plan.trips), 'unscheduled_trips': len(plan.unscheduled),
+                         'total_miles': plan.total_distance, 'late_packages': len(plan.late_packages),
+                         'packages_per_second': packages / seconds}
+    except ValueError as error:
+        stages['vrp'] = {'error': f'{type(error).__name__}: {error}'}
+
+    # mid-day changes at 10:00: cancellations and address corrections of packages not delivered yet
+    # (last, since they edit the packages and routes the other stages use)
+    redispatcher = Redispatcher(fleet, distances, table, timeline)
+    pending = sorted(parcel.id for truck in fleet for parcel in truck.packages
+                     if timeline.package_status(parcel.id, 36000) != 'Delivered')
+    changes = []
+    start = time.perf_counter()
+    for i, package_id in enumerate(rng.sample(pending, min(changes_per_instance, len(pending)))):
+        if i % 2:
+            changes.append(redispatcher.cancel_package(package_id, 36000))
+        else:
+            street = distances.locations[rng.randrange(1, len(distances))]
+            changes.append(redispatcher.correct_address(package_id, (street, 'Salt Lake City', 'UT', '84100'), 36000))
+    seconds = time.perf_counter() - start
+    stages['redispatch'] = {'seconds': seconds, 'changes': len(changes),
+                            'ms_per_change': seconds * 1000 / len(changes) if changes else 0.0,
+                            'delta_miles': sum(change.delta for change in changes)}
+
+    return report
+
+
+def git_commit():
+    """
+    Commit the benchmark ran on, if this is a git checkout
+
+    returns the commit hash or None
+    """
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              check=True, cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def print_report(report):
+    """
+    Prints one line per stage for every instance
+    """
+    print(f"commit {report['commit']}  python {report['python']}")
+    for instance in report['instances']:
+        print(f"\n{instance['packages']} packages, {instance['stops']} stops, {instance['trucks']} trucks")
+        for stage, numbers in instance['stages'].items():
+            details = '  '.join(f'{key}={value:.4g}' if isinstance(value, float) else f'{key}={value}'
+                                for key, value in numbers.items() if key != 'seconds')
+            seconds = numbers.get('seconds')
+            print(f"  {stage:<14} {'' if seconds is None else f'{seconds:10.4f}s'}  {details}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the dispatch pipeline on synthetic instances')
+    parser.add_argument('--packages', type=int, nargs='+', default=[100, 1000, 10000])
+    parser.add_argument('--stops', type=int, nargs='+', default=[50, 500, 2000],
+                        help='stops for each --packages size (the last value is reused)')
+    parser.add_argument('--trucks', type=int, default=3)
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--restarts', type=int, default=3, help='route optimizer restarts per truck')
+    parser.add_argument('--search', choices=sorted(SEARCHES), default='local')
+    parser.add_argument('--queries', type=int, default=10000, help='timeline queries to time')
+    parser.add_argument('--json', help='also write the results to this file')
+    args = parser.parse_args()
+
+    report = {'commit': git_commit(), 'python': platform.python_version(), 'instances': []}
+    for i, packages in enumerate(args.packages):
+        stops = args.stops[min(i, len(args.stops) - 1)]
+        report['instances'].append(run_instance(packages, stops, args.trucks, args.seed, args.restarts,
+                                                args.search, args.queries))
+
+    print_report(report)
+    if args.json:
+        with open(args.json, 'w') as json_file:
+            json.dump(report, json_file, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,13 +1,37 @@
 from Truck import Truck
-from Package import Package
+from Package import Package, MIDNIGHT
 from PackageHt import PackageHt
-from datetime import datetime
-from math import inf
+from DistanceMatrix import DistanceMatrix
+from Timeline import Timeline, seconds
+from LoadPlanner import LoadPlanner
+from RouteCache import RouteCache
+from DispatchPlan import DispatchPlan
+from DispatchStats import DispatchStats
+from optimizer import optimize_route, optimize_routes_parallel
+from local_search import local_search_restart
+from time_windows import construct_route
+from rebalance import rebalance
+from functools import partial
+from itertools import islice
+from datetime import datetime, timedelta
+from math import comb, inf
 import random
 import csv
+import sys
+import vrp
 
 EOD = datetime.strptime("16:59:59", '%H:%M:%S')
+DISTANCE_CSV = 'distances.csv'
+PACKAGE_CSV = 'packages.csv'
+PLAN_FILE = 'dispatch_plan.json'
+# rows of the package csv parsed at a time
+CHUNK_SIZE = 1000
 package_hashTable = PackageHt()
+distance_matrix = None
+distance_matrix_path = None
+delivery_timeline = Timeline()
+rebalance_moves = []
+route_cache = RouteCache()
 initial_trucks = [
     Truck(1, '08:00:00', 1),
     Truck(2, '09:06:00', 2),
@@ -15,49 +39,168 @@ initial_trucks = [
 ]
 
 
-def dispatch(trucks):
+def dispatch(trucks, iterations=100, time_budget=None, seed=None, patience=None, workers=None,
+             search=local_search_restart, cache=route_cache, plan_path=None, stats=DispatchStats.OFF, planner='loads'):
     """
     O(n^2) - Dispatch controller
     - Loads trucks
-    - Implements 3-opt algorithm
+    - Implements the route search (local search by default, or three_opt_restart)
     - Finds routes and distances
-    - Ensures packages are on time
+    - Ensures packages are on time (see rebalance, the moves made are kept in rebalance_moves)
+    - Builds the delivery timeline used for every point-in-time query
+
+    The optimizer budget is configurable (see optimizer.optimize_route), time_budget is split evenly across trucks.
+    With workers > 1 the restarts for every truck run in a process pool and share the whole time_budget
+    Each truck warm-starts from the best route the cache knows for its stops (None to always start cold),
+    a cache with a path is saved once the routes are found
+    With a plan_path the finished plan is saved there for load_dispatch
+    Pass DispatchStats() as stats to time every stage and count restarts and rebalance moves (see DispatchStats)
+    planner='trips' plans with the fleet solver instead of the load planner and route search (see dispatch_trips)
+
+    returns the optimizer result for each truck, the FleetPlan with planner='trips'
     """
+    if planner == 'trips':
+        return dispatch_trips(trucks, plan_path, stats)
+    if planner != 'loads':
+        raise ValueError(f"Unknown planner {planner!r}, use 'loads' or 'trips'")
 
     # import data using csv readers
-    loads = load_package_csv()
-    distances = load_distance_csv()
-    # its the same csv but this time pulls different data (just the first line of address)
-    locations = load_locations_csv()
+    loads = load_package_csv(stats=stats)
+    with stats.stage('distance_csv'):
+        distances = load_distance_csv()
+        # its the same csv but this time pulls different data (just the first line of address)
+        locations = load_locations_csv()
     # loads trucks with packages (requirements and sorting runs here - based on notes, location, and deadlines)
-    trucks = load_trucks(loads, trucks)
+    with stats.stage('load_trucks'):
+        trucks = load_trucks(loads, trucks)
 
     # for each truck, sets the dispatch time for the package
     for truck in trucks:
         for parcel in truck.packages:
             parcel.dispatch_time = truck.departure_time
 
-    # initializing variables to run the 3 opt algorithm
-    final_distances = [inf, inf, inf]
-    final_route = [[], [], []]
-
-    # runnning the 3 opt algorithm
-    for _ in range(100):
-        for i, truck in enumerate(trucks):
-            # runs the 3 opt algorithm
-            final_route[i] = three_opt_algorithm(truck, distances, locations)
-            # verifies the route is actually better
-            final_distances[i] = verify_route(
-                truck, final_route[i], final_distances[i], distances)
-
-    # make sure packages arrive by deadline or swap until they will
-    truck3 = trucks[2]
-    for i in range(len(trucks)):
-        for j in range(i + 1, len(trucks)):
-            truck1 = trucks[i]
-            truck2 = trucks[j]
-            if not truck1.on_time(distances, locations, truck3) or not truck2.on_time(distances, locations, truck3):
-                swap_packages(truck1, truck2, truck3, distances, locations)
+    # runnning the route search from random restarts until the budget is spent
+    with stats.stage('routing'):
+        if workers is not None and workers > 1:
+            start_location = distances.location_id(Truck.hub_address)
+            problems = [(truck_stops(truck), start_location, truck.id == 1, truck.time_windows())
+                        for truck in trucks]
+            results = optimize_routes_parallel(problems, distances, search, workers, iterations,
+                                               time_budget, seed, patience, cache, stats)
+        else:
+            truck_budget = time_budget / len(trucks) if time_budget is not None else None
+            results = []
+            for truck in trucks:
+                truck_seed = f'{seed}:{truck.id}' if seed is not None else None
+                cache_key = None
+                if cache is not None:
+                    cache_key = RouteCache.key(truck_stops(truck), distances.location_id(Truck.hub_address),
+                                               truck.id == 1, distances, truck.time_windows())
+                results.append(optimize_route(truck, distances, locations, partial(truck_search, search, stats=stats),
+                                              iterations, truck_budget, truck_seed, patience, cache, cache_key,
+                                              stats))
+    if cache is not None:
+        with stats.stage('route_cache'):
+            cache.save()
+
+    # verifies the route is actually better
+    for truck, result in zip(trucks, results):
+        verify_route(truck, result.route, inf, distances)
+
+    # make sure packages arrive by deadline, moving stops between trucks until they will
+    with stats.stage('rebalance'):
+        rebalance_moves[:] = rebalance(trucks, distances, trucks[2], stats=stats)
+
+    finish_dispatch(trucks, distances, plan_path, stats, 'loads')
+    return results
+
+
+def dispatch_trips(trucks, plan_path=None, stats=DispatchStats.OFF):
+    """
+    O(n k log(n k)) - Dispatch with the fleet solver (see vrp.solve) instead of the load planner and route search
+    - Every truck runs at most one trip and the trucks' drivers take turns: a trip leaves once its packages are
+      ready and a driver is back at the hub, so no truck's departure is pushed by another truck's route
+    - Pinned truck, delayed, wrong address and delivered with notes are read from each package's Constraint,
+      a wrong address package is held until its correction comes in and routed to the corrected address
+    - Raises ValueError when the trucks can't run every trip
+
+    returns FleetPlan
+    """
+    with stats.stage('distance_csv'):
+        distances = load_distance_csv()
+    with stats.stage('package_csv'):
+        packages = read_package_csv(PACKAGE_CSV, distances)
+        stats.count('packages', len(packages))
+    for parcel in packages:
+        if parcel.constraint.corrected_at is not None:
+            parcel.location_id = distances.location_id(Package.CORRECTED_ADDRESS[0])
+
+    # every driver is available from the first departure to the end of the day
+    start = min(seconds(truck.departure_time) for truck in trucks)
+    drivers = [vrp.Driver(driver, start, seconds(EOD)) for driver in dict.fromkeys(truck.driver for truck in trucks)]
+    with stats.stage('vrp'):
+        plan = vrp.solve(packages, distances, drivers, [truck.id for truck in trucks], Truck.max_capacity,
+                         Truck.avg_mph, distances.location_id(Truck.hub_address), trips_per_truck=1)
+    if plan.unscheduled:
+        package_ids = sorted(package_id for trip in plan.unscheduled for package_id in trip.package_ids)
+        raise ValueError(f'Packages {package_ids} do not fit on the {len(trucks)} trucks')
+
+    by_id = {truck.id: truck for truck in trucks}
+    for trip in plan.trips:
+        truck = by_id[trip.truck]
+        truck.departure_time = MIDNIGHT + timedelta(seconds=trip.start_time)
+        truck.driver = trip.driver
+        truck.route = trip.route
+        truck.total_distance = trip.distance
+        truck.timeline = None
+        for package_id in trip.package_ids:
+            parcel = package_hashTable.lookup(package_id)
+            truck.assign_package(parcel)
+            parcel.assign_truck(truck)
+            parcel.dispatch_seconds = trip.start_time
+    for truck in trucks:
+        truck.on_time(distances, None)
+
+    finish_dispatch(trucks, distances, plan_path, stats, 'trips')
+    return plan
+
+
+def finish_dispatch(trucks, distances, plan_path=None, stats=DispatchStats.OFF, planner='loads'):
+    """
+    O(n) - Builds the delivery timeline from the final routes, and saves the plan (built by planner)
+    when there is a plan_path
+    """
+    # index the final routes so status queries are a bisect instead of a route walk
+    with stats.stage('timeline'):
+        delivery_timeline.build(trucks, distances)
+
+    if plan_path is not None:
+        with stats.stage('save_plan'):
+            inputs = DispatchPlan.fingerprint(DISTANCE_CSV, PACKAGE_CSV)
+            DispatchPlan.from_trucks(inputs, trucks, distances, planner).save(plan_path)
+
+
+def load_dispatch(trucks, plan_path=PLAN_FILE, **options):
+    """
+    O(n) when the saved plan matches the csvs, dispatch otherwise - Loads the saved dispatch plan
+    - The packages are read into the hash table, the planned routes and assignments are restored
+      and the delivery timeline is built, without any load planning or route search
+    - If there is no plan, the csvs changed since it was saved or another planner built it,
+      runs dispatch (with the options) and saves it
+
+    returns boolean if the saved plan was used
+    """
+    plan = DispatchPlan.load(plan_path)
+    if (plan is not None and plan.planner == options.get('planner', 'loads')
+            and plan.inputs == DispatchPlan.fingerprint(DISTANCE_CSV, PACKAGE_CSV)):
+        distances = load_distance_csv()
+        read_package_csv(PACKAGE_CSV, distances)
+        plan.apply(trucks, package_hashTable)
+        delivery_timeline.build(trucks, distances)
+        return True
+
+    dispatch(trucks, plan_path=plan_path, **options)
+    return False
 
 
 def load_trucks(loads, trucks):
@@ -74,282 +217,252 @@ def load_trucks(loads, trucks):
     return trucks
 
 
-def load_distance_csv():
+def load_distance_csv(path=DISTANCE_CSV):
     """
-    O(n^2) - Loads distances from csv and stores the values
+    O(n^2) on first call, O(1) afterwards - Loads distances from csv into the shared distance matrix
+    - Loading a different csv replaces the shared matrix
 
     returns distances
     """
+    global distance_matrix, distance_matrix_path
 
-    with open('distances.csv') as distance_file:
-        reader = csv.reader(distance_file)
-        addresses = next(reader)[2:]
-        distances = [[None] * len(addresses) for _ in range(len(addresses))]
-
-        for i, row in enumerate(reader):
-            for j, distance in enumerate(row[2:]):
-                distances[i][j] = float(distance) if distance else None
+    if distance_matrix is None or distance_matrix_path != path:
+        distance_matrix = DistanceMatrix.from_csv(path)
+        distance_matrix_path = path
 
-    return distances
+    return distance_matrix
 
 
 def load_locations_csv():
     """
-    O(n) - Loads locations from csv, includes only the first line, and stores in a list
+    O(1) - Locations from the shared distance matrix, includes only the first line of each address
 
     returns locations
     """
 
-    with open('distances.csv') as distance_file:
-        reader = csv.reader(distance_file, delimiter=',')
-        addresses = next(reader)[2:]
-        locations = []
-        for address in addresses:
-            formatted_address = address.splitlines()[1].strip(', ')
-            locations.append(formatted_address)
+    return load_distance_csv().locations
 
-    return list(locations)
 
+def load_package_csv(path=PACKAGE_CSV, distances=None, chunk_size=CHUNK_SIZE, stats=DispatchStats.OFF):
+    """
+    O(n log n) - Streams the packages csv into the load planner and sorts it into truck loads
+    - Packages are handed to the planner chunk by chunk as the csv is read, no package list is built
+    - stats: DispatchStats, times reading the csv ('package_csv') and planning the loads ('load_plan')
 
-def load_package_csv():
+    returns: dictionary of loads, filled with package ids for each truck
     """
-    O(1) - Load the packages csv
+    planner = LoadPlanner(EOD, Truck.max_capacity)
+    with stats.stage('package_csv'):
+        for chunk in stream_packages(path, distances, chunk_size):
+            for package in chunk:
+                planner.add(package)
+            stats.count('packages', len(chunk))
+
+    with stats.stage('load_plan'):
+        return planner.plan()
+
+
+def read_package_csv(path=PACKAGE_CSV, distances=None, package_table=package_hashTable):
+    """
+    O(n) - Read the packages csv into package objects and the package hash table
+    - package_table: hash table to fill, the shared one by default
 
     returns: list of packages
     """
-    # package_list, will be used to sort packages
-    package_list = []
 
-    # read csv
-    with (open('packages.csv') as package_file):
+    return [package for chunk in stream_packages(path, distances, package_table=package_table) for package in chunk]
+
+
+def stream_packages(path=PACKAGE_CSV, distances=None, chunk_size=CHUNK_SIZE, package_table=package_hashTable):
+    """
+    O(n) - Generator of package objects, chunk_size at a time, inserted into the package hash table as they are read
+    - Only one chunk of rows is held at a time
+
+    yields: list of packages
+    """
+    # addresses are resolved to location ids once, here
+    if distances is None:
+        distances = load_distance_csv()
+
+    for chunk in read_package_rows(path, chunk_size):
+        packages = []
+        for line, package_id, address, deadline, weight, notes in chunk:
+            try:
+                location_id = distances.location_id(Package.addresses.rows[address][0])
+            except LookupError as error:
+                raise ValueError(f'{path} line {line}: {error}')
+
+            # create package object and insert it into the package hash table
+            new_package = Package(package_id, address, deadline, weight, notes, None, location_id)
+            package_table.insert(package_id, new_package)
+            packages.append(new_package)
+        yield packages
+
+
+def read_package_rows(path=PACKAGE_CSV, chunk_size=CHUNK_SIZE):
+    """
+    O(n) - Generator of validated, normalized package csv rows, chunk_size at a time
+    - Surrounding whitespace is stripped, repeated address, city, state and zip strings are interned
+    - Each distinct deadline string is parsed once, to seconds since midnight
+    - Raises ValueError naming the line for a malformed row or a repeated package id
+
+    yields: list of (line, package id, address id, deadline, weight, notes)
+    """
+    deadlines = {'EOD': seconds(EOD)}
+    seen = set()
+
+    with open(path, newline='') as package_file:
         reader = csv.reader(package_file, delimiter=',')
         next(reader)  # skips first line (header)
+        numbered = ((reader.line_num, row) for row in reader)
+
+        while True:
+            rows = list(islice(numbered, chunk_size))
+            if not rows:
+                break
 
-        # creates packages
-        for row in reader:
-            package_id = int(row[0])
-            address = {
-                "address": row[1],
-                "city": row[2],
-                "state": row[3],
-                "zip": row[4],
-            }
-            deadline = datetime.strptime(
-                row[5], '%H:%M %p') if row[5][0].isnumeric() else EOD
-            weight = row[6]
-            notes = row[7]
-            truck = None
-
-            # create package object
-            new_package = Package(package_id, address,
-                                  deadline, weight, notes, truck)
-            # insert into the package hash table
-            package_hashTable.insert(package_id, new_package)
-            # append them to the package list
-            package_list.append(new_package)
-    package_list = sort_package_load_list(package_list)
-    # return the package list
-    return package_list
-
-
-def sort_package_load_list(package_list):
-    """
-    O(n) - Sort the packages into truck load lists based on:
+            chunk = []
+            for line, row in rows:
+                if not any(field.strip() for field in row):
+                    continue
+                if len(row) < 8:
+                    raise ValueError(f'{path} line {line}: expected 8 columns, found {len(row)}')
+                fields = [field.strip() for field in row]
+
+                try:
+                    package_id = int(fields[0])
+                    float(fields[6])
+                except ValueError:
+                    raise ValueError(f'{path} line {line}: package id and weight must be numbers')
+                if package_id in seen:
+                    raise ValueError(f'{path} line {line}: package {package_id} is listed twice')
+                seen.add(package_id)
+
+                deadline = deadlines.get(fields[5])
+                if deadline is None:
+                    try:
+                        deadline = deadlines[fields[5]] = seconds(datetime.strptime(fields[5], '%I:%M %p'))
+                    except ValueError:
+                        raise ValueError(f'{path} line {line}: unknown deadline {fields[5]!r}')
+
+                address = Package.addresses.intern(sys.intern(' '.join(fields[1].split())), sys.intern(fields[2]),
+                                                   sys.intern(fields[3]), sys.intern(fields[4]))
+                chunk.append((line, package_id, address, deadline, fields[6], fields[7]))
+            yield chunk
+
+
+def sort_package_load_list(package_list, trucks=(1, 2, 3)):
+    """
+    O(n log n) - Sort the packages into truck load lists based on:
     - Special notes
     - Deadlines
     - Locations
+    - trucks: Tuple of truck numbers, one load each (see LoadPlanner)
 
     returns: list of loads, filled with packages for each truck
     """
-    group_set = set()
-    package_list.sort(key=lambda package: package.deadline)
-    original_list = package_list.copy()
-    loads = {1: [], 2: [], 3: []}
-    loaded_packages = []
-
-    # sorts packages by sorting criteria in the notes
+    planner = LoadPlanner(EOD, Truck.max_capacity, trucks)
     for package in package_list:
-        if package.notes:
-            note = package.notes
-
-            # if must be from a specific truck
-            if 'on truck' in note:
-                truck = int(note.split()[-1])
-                loads[truck].append(package.id)
-                loaded_packages.append(package)
-                continue
-
-            # if must be delivered later due to wrong address
-            if 'Wrong address' in note:
-                loads[3].append(package.id)
-                loaded_packages.append(package)
-                continue
-
-            # if needs to be delivered along with another package (same truck)
-            if 'delivered with' in note:
-                group = list(
-                    map(int, note[note.find('with') + 5:].split(', ')))
-                group_set.add(package.id)
-                loaded_packages.append(package)
-                if package.id not in loads[1]:
-                    loads[1].append(package.id)
-                    for item in group:
-                        group_set.add(item)
-                        for copy_pkg in original_list:
-                            if copy_pkg.id == item and copy_pkg.id not in loads[1]:
-                                loads[1].append(copy_pkg.id)
-                                loaded_packages.append(copy_pkg)
-
-            # if the package is delayed and must be delivered later
-            if 'Delayed' in note:
-                time_str = next(word for word in note.split()
-                                if word[0].isdigit())
-                delay_time = datetime.strptime(
-                    time_str, '%H:%M').time()
-                if delay_time.hour < 9:
-                    loads[1].append(package.id)
-                elif delay_time.hour < 10 or (delay_time.hour == 10 and delay_time.minute < 20):
-                    loads[2].append(package.id)
-                else:
-                    loads[3].append(package.id)
-                loaded_packages.append(package)
-                continue
-
-    # remove loaded packages from list
-    loaded_ids = set(id for truck in loads.values() for id in truck)
-    package_list = [
-        pkg for pkg in package_list if pkg.id not in loaded_ids]
-    original_list = package_list.copy()
-
-    # gather locations for each truck
-    truck_locales = {1: set(), 2: set(), 3: set()}
-    for truck_num, truck_load in loads.items():
-        for pkg in loaded_packages:
-            if pkg.id in truck_load:
-                truck_locales[truck_num].add(pkg.address["address"])
-                truck_locales[truck_num].add(pkg.address["zip"])
-
-    # assign based on location deadline
-    for pkg in package_list.copy():
-        if pkg.deadline != EOD:
-            for truck_num in (1, 2, 3):
-                if (pkg.address["address"] in truck_locales[truck_num] or
-                        pkg.address["zip"] in truck_locales[truck_num]) and len(loads[truck_num]) < 16:
-                    loads[truck_num].append(pkg.id)
-                    loaded_packages.append(pkg)
-                    package_list.remove(pkg)
-                    break
-
-    for pkg in package_list.copy():
-        if pkg.deadline != EOD:
-            loads[1].append(pkg.id)
-            loaded_packages.append(pkg)
-            package_list.remove(pkg)
-
-    original_list = package_list.copy()
-
-    # match by address
-    for truck_num, truck_load in loads.items():
-        for loaded_pkg in loaded_packages:
-            if loaded_pkg.id in truck_load:
-                for pkg in original_list.copy():
-                    if pkg.address["address"] == loaded_pkg.address["address"] and len(truck_load) < 16:
-                        truck_load.append(pkg.id)
-                        if pkg in package_list:
-                            package_list.remove(pkg)
-
-    original_list = package_list.copy()
-
-    # match by zip
-    for truck_num, truck_load in loads.items():
-        for loaded_pkg in loaded_packages:
-            if loaded_pkg.id in truck_load:
-                for pkg in original_list.copy():
-                    if pkg.address["zip"] == loaded_pkg.address["zip"] and len(truck_load) < 16:
-                        truck_load.append(pkg.id)
-                        if pkg in package_list:
-                            package_list.remove(pkg)
-
-    # load remaining packages
-    for pkg in package_list.copy():
-        truck_sizes = {k: len(v) for k, v in loads.items()}
-        for truck_num in sorted(truck_sizes, key=lambda x: (truck_sizes[x], x)):
-            if len(loads[truck_num]) < Truck.max_capacity:
-                loads[truck_num].append(pkg.id)
-                package_list.remove(pkg)
-                break
-        else:
-            raise IndexError('Trucks are at max capacity')
+        planner.add(package)
 
-    return loads
+    return planner.plan()
 
 
-def update_ending_location(truck, route, start_location):
+def truck_search(search, truck, distances, locations_param, rng=random, stats=DispatchStats.OFF):
     """
-    O(1) - Updates special case, setting starting location for first truck
+    O(search) - Runs a route search restart over the truck's stops
+    - The search is given the truck's deadlines, departure and speed (see time_windows)
+    - stats: DispatchStats, passed on to the search to count the candidate moves it scores
+
+    returns the improved route
     """
-    if truck.id == 1:
-        route.append(start_location)
-    return route
 
+    start_location = distances.location_id(Truck.hub_address)
+
+    # the hub returns at the end for truck with id of 1
+    return search(truck_stops(truck), start_location, truck.id == 1, distances, rng, truck.time_windows(), stats=stats)
 
-def three_opt_algorithm(truck, distances, locations_param):
+
+def truck_stops(truck):
     """
-    O(n^3) - Get the original truck route, remove, swap, 3 locations on the route continuously
-    - Goal: Finding the shortest overall distance
-    - Minimizing paths on the route that cross over others
+    O(n) - Location ids the truck has to visit, without duplicates
+
+    returns list of location ids
+    """
+
+    return list({parcel.location_id for parcel in truck.packages})
+
+
+def three_opt_restart(stops, start_location, closed, distances, rng=random, windows=None, stats=DispatchStats.OFF):
     """
+    O(n^3) - Runs the 3-opt algorithm from a random ordering of the stops
+    - Needs no truck or package objects, so it can run in a worker process
+    - With time windows it starts from a randomized deadline-aware insertion instead (3-opt moves do not check them)
+    - stats: DispatchStats, counts the candidate moves scored ('route candidates')
 
-    start_location = locations_param.index(Truck.hub_address)
-    locations = []
+    returns the improved route
+    """
 
-    for parcel in truck.packages:
-        location = parcel.address["address"]
-        for place in locations_param:
-            if place == location:
-                locations.append(locations_param.index(place))
-                continue
+    if windows is not None:
+        route = construct_route(stops, start_location, closed, distances, windows, rng)
+        return three_opt_route(route, distances, stats)
 
-    # removes duplicate locations and randomizes the route
-    locations = list(set(locations))
-    random.shuffle(locations)
+    # randomizes the route
+    locations = list(stops)
+    rng.shuffle(locations)
 
-    # insert the hub at the beginning each truck and at the end for truck with id of 1
+    # insert the hub at the beginning and at the end for a closed route
     locations.insert(0, start_location)
-    if truck.id == 1:
-        locations = update_ending_location(truck, locations, start_location)
+    if closed:
+        locations.append(start_location)
+
+    return three_opt_route(locations, distances, stats)
+
+
+def three_opt_route(route, distances, stats=DispatchStats.OFF):
+    """
+    O(n^3) per pass - Improves a route in place by reversing two neighbouring segments
+    - Each move is scored in O(1) from the three edges it removes and the three it adds
+    - The route is only rebuilt when a move is accepted
+    - The first location (hub) never moves and a closing hub stays at the end
+    - stats: DispatchStats, counts the candidate moves scored ('route candidates')
+
+    returns the improved route
+    """
+
+    # the last index a move may touch (the closing hub is fixed for truck 1)
+    last = len(route) - 1
+    if len(route) > 1 and route[-1] == route[0]:
+        last -= 1
+    d = distances.d
 
-    best_route = locations
     improved = True
     while improved:
         improved = False
-
-        # O(n^3) - iterating through the route assigning three variables to neighboring locations
-        for i in range(1, len(truck.packages) - 3):
-            for j in range(i + 1, len(truck.packages) - 2):
-                for k in range(j + 1, len(truck.packages) - 1):
-
-                    # O(1) - create a new_route by swapping
-                    new_route = (locations[:i] + locations[i:j + 1][::-1] + locations[j + 1:k + 1][::-1] +
-                                 locations[k + 1:])
-
-                    # O(1) - get the distance from the hug to the first route location
-                    start_of_best_route = [start_location, best_route[0]]
-                    start_of_new_route = [start_location, new_route[0]]
-
-                    # O(1) - get distance of the route
-                    best_starting_distance = calculate_distance(
-                        start_of_best_route, distances)
-                    new_starting_distance = calculate_distance(
-                        start_of_new_route, distances)
-
-                    # O(1) - update best_route to the shortest route
-                    if (calculate_distance(new_route, distances) + new_starting_distance) < (
-                            calculate_distance(best_route, distances) + best_starting_distance):
-                        best_route = new_route
+        # every pass scores each (i, j, k) of the movable positions once
+        stats.count('route candidates', comb(max(last, 0), 3))
+
+        # O(n^3) - iterating through the stops of the route assigning three variables to neighboring locations
+        for i in range(1, last - 1):
+            for j in range(i + 1, last):
+                for k in range(j + 1, last + 1):
+
+                    # O(1) - edges (a, b), (c, n), (e, f) become (a, c), (b, e), (n, f)
+                    a, b = route[i - 1], route[i]
+                    c, n = route[j], route[j + 1]
+                    e = route[k]
+                    delta = d(a, c) + d(b, e) - d(a, b) - d(c, n)
+                    if k + 1 < len(route):
+                        f = route[k + 1]
+                        delta += d(n, f) - d(e, f)
+
+                    # O(n) - only rebuild the route when the move shortens it
+                    if delta < -1e-9:
+                        route[i:k + 1] = route[i:j + 1][::-1] + \
+                            route[j + 1:k + 1][::-1]
                         improved = True
 
-    return best_route
+    return route
 
 
 def calculate_distance(route, distances):
@@ -357,18 +470,7 @@ def calculate_distance(route, distances):
     O(n) - Calculates distance between all locations in a route
     """
 
-    distance = 0
-
-    for i in range(len(route) - 1):
-        loc1 = route[i]
-        loc2 = route[i + 1]
-
-        if distances[loc1][loc2]:
-            distance += distances[loc1][loc2]
-        else:
-            distance += distances[loc2][loc1]
-
-    return distance
+    return distances.route_length(route)
 
 
 def verify_route(truck, route, distance, distance_list):
@@ -384,49 +486,3 @@ def verify_route(truck, route, distance, distance_list):
         truck.update_route(route, distance)
 
     return distance
-
-
-def swap_packages(truck1, truck2, truck3, distances, locations):
-    """
-    O(n^2) - Swap packages when one is not on time
-    - Confirm swap if packages are on time or revert if the packages are still not on time
-
-    returns true if swap is successful and false if not
-    """
-
-    for parcel1 in truck1.packages:
-        for parcel2 in truck2.packages:
-            if not parcel1.notes and not parcel2.notes:
-                current_route1 = truck1.route.copy()
-                current_route2 = truck2.route.copy()
-
-                # remove each package from its truck, swap trucks and update assigned packages
-                truck1.unassign_package(parcel1)
-                truck2.unassign_package(parcel2)
-                truck1.assign_package(parcel2)
-                truck2.assign_package(parcel1)
-                parcel2.truck = 1
-                parcel1.truck = 2
-
-                # re-run truck through 3-opt algorithm and find best one
-                truck1.route = three_opt_algorithm(
-                    truck1, distances, locations)
-                truck2.route = three_opt_algorithm(
-                    truck2, distances, locations)
-
-                # check if packages are now on time
-                if truck1.on_time(distances, locations, truck3) and truck2.on_time(distances, locations, truck3):
-                    return True
-
-                # if still not on time, revert changes
-                else:
-                    truck1.unassign_package(parcel2)
-                    truck2.unassign_package(parcel1)
-                    truck1.assign_package(parcel1)
-                    truck2.assign_package(parcel2)
-                    parcel1.truck = 1
-                    parcel2.truck = 2
-                    truck1.route = current_route1
-                    truck2.route = current_route2
-
-    return False
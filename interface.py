@@ -1,24 +1,24 @@
 import datetime
 import sys
-from helper import load_distance_csv, load_locations_csv, update_ending_location
+from Package import MIDNIGHT
+from queries import fleet_at, package_at, status_at
 
 
 def interface_main(package_hashTable, trucks):
     """
     O(1) - Interface of the initial menu for the routing service
+    - Reports return here, so a long session loops instead of growing the call stack
     """
 
-    # will loop until user exits program, or enters valid option
+    # will loop until user exits program
     while True:
         show_main_menu()
         time_input = input("Enter option: ").strip()
 
         if time_input == '1':
             current_time_menu(package_hashTable, trucks)
-            break
         elif time_input == '2':
             custom_time_menu(package_hashTable, trucks)
-            break
         elif time_input == '3':
             print('\nGoodbye!\n')
             sys.exit()
@@ -48,28 +48,7 @@ def current_time_menu(package_hashTable, trucks):
     time_now = datetime.datetime.now().time()
 
     # shows menu for getting reports for the current time
-    while True:
-        print(
-            f"\n\n\nThe current time is {time_now.strftime('%I:%M %p')}\n\n"
-            '1 - Report of All Packages\n'
-            '2 - Look Up a Specific Package\n'
-            '3 - See All Trucks Summary\n'
-            '4 - Exit the Program\n\n'
-        )
-
-        menu_input = input('Enter option: ')
-        if menu_input == '1':
-            print(print_all_packages(time_now, package_hashTable, trucks))
-        elif menu_input == '2':
-            package_lookup(time_now, package_hashTable, trucks)
-        elif menu_input == '3':
-            truck_stats(time_now, package_hashTable, trucks)
-        elif menu_input == '4':
-            print('\n\nGoodbye!\n')
-            sys.exit()
-        else:
-            print(
-                '\n\nPlease enter a valid option and press enter.\n\n')
+    report_menu(f"\n\n\nThe current time is {time_now.strftime('%I:%M %p')}\n\n", time_now, package_hashTable, trucks)
 
 
 def custom_time_menu(package_hashTable, trucks):
@@ -77,21 +56,28 @@ def custom_time_menu(package_hashTable, trucks):
     O(1) - Allows user to pick a custom time, and get reports
     """
 
-    custom_time = (
-        input('\n\n\n\nEnter the Custom Time (HH:MM am/pm): '))
-    try:
-        custom_time = datetime.datetime.strptime(
-            custom_time, '%I:%M %p').time()
-    except ValueError:
-        print(
-            '\n\nPlease enter a valid time. Use 12-hour format, followed by a space and \'am\' or \'pm\'.\n\n')
-        custom_time_menu(package_hashTable, trucks)
-
     while True:
+        custom_time = (
+            input('\n\n\n\nEnter the Custom Time (HH:MM am/pm): '))
+        try:
+            custom_time = datetime.datetime.strptime(
+                custom_time, '%I:%M %p').time()
+            break
+        except ValueError:
+            print(
+                '\n\nPlease enter a valid time. Use 12-hour format, followed by a space and \'am\' or \'pm\'.\n\n')
+
+    report_menu(f"You entered {custom_time.strftime('%I:%M %p')}.\n\n"
+                'Report Options:\n', custom_time, package_hashTable, trucks)
 
-        print(f"You entered {custom_time.strftime('%I:%M %p')}.\n\n"
 
-              'Report Options:\n'
+def report_menu(heading, query_time, package_hashTable, trucks):
+    """
+    O(1) - Report options for a time, returns once a report was shown and the user asked for the main menu
+    """
+
+    while True:
+        print(heading +
 
               '1 - Report of All Packages\n'
               '2 - Look Up a Specific Package\n'
@@ -101,11 +87,14 @@ def custom_time_menu(package_hashTable, trucks):
 
         menu_input = input('Enter option: ')
         if menu_input == '1':
-            print(print_all_packages(custom_time, package_hashTable, trucks))
+            print_all_packages(query_time, package_hashTable, trucks)
+            return
         elif menu_input == '2':
-            package_lookup(custom_time, package_hashTable, trucks)
+            package_lookup(query_time, package_hashTable, trucks)
+            return
         elif menu_input == '3':
-            truck_stats(custom_time, package_hashTable, trucks)
+            truck_stats(query_time, package_hashTable, trucks)
+            return
         elif menu_input == '4':
             print('\n\nGoodbye!\n')
             sys.exit()
@@ -114,6 +103,24 @@ def custom_time_menu(package_hashTable, trucks):
                 '\n\nPlease enter a valid option and press enter.\n\n')
 
 
+def return_to_main_menu(goodbye):
+    """
+    O(1) - Returns if the user asked for the main menu, exits the program otherwise
+    """
+    next_input = input(
+        '\nEnter 0 to return to the main menu.\nEnter any other key to exit.\n')
+    if next_input != '0':
+        print(goodbye)
+        sys.exit()
+
+
+def clock(seconds):
+    """
+    O(1) - HH:MM am/pm of seconds since midnight
+    """
+    return (MIDNIGHT + datetime.timedelta(seconds=seconds)).strftime('%I:%M %p')
+
+
 def print_package_report_header(custom_time):
     line = '-' * 83
     time_str = custom_time.strftime('%I:%M %p')
@@ -130,8 +137,8 @@ def print_all_packages(custom_time, package_hashTable, trucks):
     Prints all the packages and their information along with status and delivery details
     """
 
-    # updates status according to the custom time chosen
-    package_hashTable.update_all_statuses(custom_time)
+    # status of every package at the time chosen (see queries.status_at)
+    states = status_at(custom_time, package_hashTable)
 
     # assignin headers for viewing it in columns
     id_header = 'ID'
@@ -149,37 +156,16 @@ def print_all_packages(custom_time, package_hashTable, trucks):
                                                              notes_header, status_header, truck_header,
                                                              delivery_header))
 
-    # parses the package hash table using the look up function and populates the package data
-    for i in range(1, 41):
-        current_package = package_hashTable.lookup(i)
-        package_id = current_package.id
-        address = current_package.address["address"][:26]
-        deadline = current_package.deadline.time().strftime('%I:%M %p')
-        notes = current_package.notes
-        status = current_package.status
-        truck = current_package.truck
-        delivery_time = current_package.delivery_time.time()
-        delivery_details = ''
-        if custom_time < delivery_time:
-            delivery_details = f"{delivery_time.strftime('%I:%M %p')}"
-        elif custom_time >= delivery_time:
-            delivery_details = f"{delivery_time.strftime('%I:%M %p')}"
-
-        if not isinstance(truck, int):
-            truck = truck.id
-        print('  %-15s %-35s %-22s %-36s %-15s %-12s %15s' % (package_id, address, deadline, notes.split('-')[0],
-                                                              status, truck, delivery_details))
+    # packages come in id order
+    for state in states:
+        print('  %-15s %-35s %-22s %-36s %-15s %-12s %15s' % (state.id, state.address[:26], clock(state.deadline),
+                                                              state.notes.split('-')[0], state.status, state.truck,
+                                                              clock(state.delivery_time)))
 
     print('\n')
 
     # can return to the main menu or exit the program
-    next_input = input(
-        '\nEnter 0 to return to the main menu.\nEnter any other key to exit.\n')
-    if next_input == '0':
-        interface_main(package_hashTable, trucks)
-    else:
-        print('\n\n\n\nGoodbye!\n\n\n')
-        sys.exit()
+    return_to_main_menu('\n\n\n\nGoodbye!\n\n\n')
 
 
 def print_package_lookup_header(custom_time):
@@ -199,57 +185,40 @@ def package_lookup(custom_time, package_hashTable, trucks):
     Show the details of a packae at a certain point in time
     """
 
-    # update the package statuses
-    package_hashTable.update_all_statuses(custom_time)
-
     # get users package id to look up
-    p_query = int(input('Enter a Package ID number: '))
-    if p_query not in range(1, len(package_hashTable.table) + 1):
+    while True:
+        p_query = input('Enter a Package ID number: ')
+        state = package_at(int(p_query), custom_time, package_hashTable) if p_query.strip().isdigit() else None
+        if state is not None:
+            break
         print('\n\nPlease enter a valid Package ID number and press enter.\n\n')
-        package_lookup(custom_time, package_hashTable, trucks)
-    else:
-        pass
-
-    parcel = package_hashTable.lookup(p_query)
 
     # print the report header
     print_package_lookup_header(custom_time)
 
     # print the package information
-    print(f'    Package ID: {parcel.id}\n'
-          f'    Address: {parcel.address["address"]}\n'
-          f'    City: {parcel.address["city"]}\n'
-          f'    State: {parcel.address["state"]}\n'
-          f'    Zip Code: {parcel.address["zip"]}\n'
-          f'    Weight: {parcel.weight}\n'
-          f"    Delivery Deadline: {parcel.deadline.time().strftime('%I:%M %p')}\n"
-          f'    Notes: {parcel.notes}\n'
-          f'    Truck: {parcel.truck}\n'
-          f'    Status: {parcel.status}\n'
+    print(f'    Package ID: {state.id}\n'
+          f'    Address: {state.address}\n'
+          f'    City: {state.city}\n'
+          f'    State: {state.state}\n'
+          f'    Zip Code: {state.zip}\n'
+          f'    Weight: {state.weight}\n'
+          f"    Delivery Deadline: {clock(state.deadline)}\n"
+          f'    Notes: {state.notes}\n'
+          f'    Truck: {state.truck}\n'
+          f'    Status: {state.status}\n'
           )
-    if custom_time < parcel.delivery_time.time():
-        print(
-            f"Expected Delivery Time: {parcel.delivery_time.time().strftime('%I:%M %p')}")
-    elif custom_time >= parcel.delivery_time.time():
-        print(
-            f"Delivered At: {parcel.delivery_time.time().strftime('%I:%M %p')}")
-
-    distances = load_distance_csv()
-    l1, m1 = trucks[0].execute_route(custom_time, distances)
-    l2, m2 = trucks[0].execute_route(custom_time, distances)
-    l3, m3 = trucks[0].execute_route(custom_time, distances)
-    print(f'\nCumulative Truck Miles: {round(m1 + m2 + m3, 1)}')
+    if state.status == 'Delivered':
+        print(f"Delivered At: {clock(state.delivery_time)}")
+    else:
+        print(f"Expected Delivery Time: {clock(state.delivery_time)}")
+
+    print(f'\nCumulative Truck Miles: {round(fleet_at(custom_time, trucks).total_miles, 1)}')
 
     print()
 
     # allows users to return to the main menu or exit the program
-    next_input = input(
-        '\nEnter 0 to return to the main menu.\nEnter any other key to exit.\n')
-    if next_input == '0':
-        interface_main(package_hashTable, trucks)
-    else:
-        print('\n\n\n\nGoodbye!\n\n\n')
-        sys.exit()
+    return_to_main_menu('\n\n\n\nGoodbye!\n\n\n')
 
 
 def print_truck_stats_report_header(custom_time):
@@ -271,56 +240,29 @@ def truck_stats(custom_time, package_hashTable, trucks):
     """
     Show all truck statistics.
     """
-    distances = load_distance_csv()
-    locations = load_locations_csv()
-
-    # collects and sorts packages by truck
-    truck_packages = {truck.id: [] for truck in trucks}
-    for truck in trucks:
-        for parcel in truck.packages:
-            truck_packages[truck.id].append(str(parcel.id))
-    for pkg_list in truck_packages.values():
-        pkg_list.sort()
+    fleet = fleet_at(custom_time, trucks)
 
     print_truck_stats_report_header(custom_time)
     print('\n\n')
 
-    total_miles = 0
-
-    for truck in trucks:
-        packages = truck_packages[truck.id]
+    for truck in fleet.trucks:
         print(f'---------------  Truck {truck.id}  ----------------')
         print('General Information')
-        print(
-            f"Departure Time: {truck.departure_time.time().strftime('%I:%M %p')}")
+        print(f"Departure Time: {clock(truck.departure)}")
         print(f'Driver: {truck.driver}')
-        print("Today's Assigned Packages: " + ', '.join(packages))
-
-        progress_location, progress_miles = truck.execute_route(
-            custom_time, distances)
-        total_miles += progress_miles
+        print("Today's Assigned Packages: " + ', '.join(map(str, truck.packages)))
 
         print('\nCurrent Progress')
-        if truck.route and progress_location == truck.route[-1]:
-            if truck.id == 1 and truck.route[-1] != 0:
-                update_ending_location(truck, truck.route, 0)
-                progress_location = 0
-        print(f'Latest Location: {locations[progress_location]}')
-        print(f'Miles Traveled so Far: {round(progress_miles, 1)}')
-
-        if truck.route and progress_location == truck.route[-1]:
+        print(f'Latest Location: {truck.location}')
+        print(f'Miles Traveled so Far: {round(truck.miles, 1)}')
+
+        if truck.completed:
             print('Route Completed')
         print('\n')
 
     # summary
     print(
-        f"Total miles traveled by {custom_time.strftime('%I:%M %p')}: {round(total_miles, 1)}\n\n")
+        f"Total miles traveled by {custom_time.strftime('%I:%M %p')}: {round(fleet.total_miles, 1)}\n\n")
 
     # menu navigation
-    next_input = input(
-        '\nEnter 0 to return to the main menu.\nEnter any other key to exit.\n')
-    if next_input == '0':
-        interface_main(package_hashTable, trucks)
-    else:
-        print('\n\nGoodbye!\n\n\n')
-        sys.exit()
+    return_to_main_menu('\n\nGoodbye!\n\n\n')
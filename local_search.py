@@ -0,0 +1,232 @@
+from collections import deque
+from functools import lru_cache
+import heapq
+import random
+
+from DispatchStats import DispatchStats
+from time_windows import construct_route
+
+# candidate moves only connect a stop to one of its nearest neighbors
+NEIGHBORS = 8
+# longest segment relocated by an Or-opt move
+SEGMENT_LENGTH = 3
+EPSILON = 1e-9
+
+
+@lru_cache(maxsize=64)
+def neighbor_lists(distances, nodes, k=NEIGHBORS):
+    """
+    O(n^2 log k) - The k nearest other nodes of every node, nearest first
+    - nodes: tuple of location ids, hashable so restarts on the same stop set reuse the lists
+
+    returns dict of location id -> list of location ids
+    """
+    d = distances.d
+    return {a: heapq.nsmallest(k, (b for b in nodes if b != a), key=lambda b: d(a, b)) for a in nodes}
+
+
+class LazyNeighbors(dict):
+    """
+    The same lists as neighbor_lists, each found the first time its node is looked up
+    - For repairing a long route, where only the stops near a change are examined
+    """
+
+    def __init__(self, distances, nodes, k=NEIGHBORS):
+        """
+        O(1) - Initializing the lists, none is found yet
+        """
+        super().__init__()
+        self.distances = distances
+        self.nodes = nodes
+        self.k = k
+
+    def __missing__(self, a):
+        """
+        O(n log k) - The k nearest other nodes of a node, nearest first
+        """
+        d = self.distances.d
+        near = self[a] = heapq.nsmallest(self.k, (b for b in self.nodes if b != a), key=lambda b: d(a, b))
+        return near
+
+
+def local_search_restart(stops, start_location, closed, distances, rng=random, windows=None, stats=DispatchStats.OFF):
+    """
+    O(n * k^2) per pass - Runs the local search from a random ordering of the stops
+    - Same signature as three_opt_restart so either can drive the optimizer
+    - With time windows the search starts from a randomized deadline-aware insertion instead,
+      and keeps every deadline that route meets
+    - stats: DispatchStats, counts the candidate moves scored ('route candidates')
+
+    returns the improved route
+    """
+    if windows is not None:
+        route = construct_route(stops, start_location, closed, distances, windows, rng)
+    else:
+        route = list(stops)
+        rng.shuffle(route)
+        route.insert(0, start_location)
+        if closed:
+            route.append(start_location)
+
+    neighbors = neighbor_lists(distances, tuple(sorted(set(route))))
+    return improve_route(route, distances, neighbors, windows, stats=stats)
+
+
+def improve_route(route, distances, neighbors, windows=None, active=None, closed=None, stats=DispatchStats.OFF):
+    """
+    O(n * k^2) per pass - Improves a route in place with 2-opt, Or-opt and 3-opt segment exchange moves
+    - Only moves that create an edge between a stop and one of its neighbors are scored, each in O(1)
+    - Don't-look bits: a stop is only re-examined after one of its edges changes
+    - The first location (hub) never moves and a closing hub stays at the end
+    - windows: optional TimeWindows, when the starting route is on time any move that would make a
+      stop late is rejected with an O(1) slack check (a late starting route is only shortened)
+    - active: optional stops to examine first, for repairing a route after a local change (default every stop)
+    - closed: keep the last location at the end, by default when the route returns to its first location
+      (a route starting mid-way, at a truck's current stop, can still end at the hub)
+    - stats: DispatchStats, counts the candidate moves scored ('route candidates')
+
+    returns the improved route
+    """
+    d = distances.d
+    size = len(route)
+    end = size - 1
+    if closed is None:
+        closed = size > 1 and route[-1] == route[0]
+    last = size - 2 if size > 1 and closed else size - 1
+    hub = route[0]
+    pos = {}
+    times = None
+    evaluated = 0
+
+    def reindex():
+        nonlocal times
+        for idx in range(1, last + 1):
+            pos[route[idx]] = idx
+        if windows is not None:
+            times = windows.route_times(route, distances)
+            if not times.feasible():
+                times = None
+
+    def on_time(pieces):
+        # pieces are (i, j) position ranges of the current route, reversed when i > j
+        return times is None or times.pieces_feasible([(i, j) for i, j in pieces if j <= end and i <= end])
+
+    def at(p):
+        return route[p] if p < size else None
+
+    def cost(p):
+        return d(route[p], route[p + 1]) if p + 1 < size else 0.0
+
+    def link(a, b):
+        return d(a, b) if a is not None and b is not None else 0.0
+
+    reindex()
+    active = deque(route[1:last + 1] if active is None else (node for node in dict.fromkeys(active) if node in pos))
+    queued = set(active)
+
+    while active:
+        a = active.popleft()
+        queued.discard(a)
+        p = pos[a]
+        best_delta, best_move = -EPSILON, None
+
+        for c in neighbors[a]:
+            q = pos.get(c)
+            if q is None or c == hub:
+                continue
+            x, y = min(p, q), max(p, q)
+
+            # 2-opt, reverse x+1..y: edges (x, x+1), (y, y+1) become (x, y), (x+1, y+1)
+            if y > x + 1:
+                evaluated += 1
+                delta = d(route[x], route[y]) + link(route[x + 1], at(y + 1)) - cost(x) - cost(y)
+                if delta < best_delta and on_time(((0, x), (y, x + 1), (y + 1, end))):
+                    best_delta, best_move = delta, ('reverse', x + 1, y)
+
+            # 2-opt, reverse x..y-1: edges (x-1, x), (y-1, y) become (x-1, y-1), (x, y)
+            if y - 1 > x:
+                evaluated += 1
+                delta = d(route[x - 1], route[y - 1]) + d(route[x], route[y]) - cost(x - 1) - cost(y - 1)
+                if delta < best_delta and on_time(((0, x - 1), (y - 1, x), (y, end))):
+                    best_delta, best_move = delta, ('reverse', x, y - 1)
+
+            # Or-opt, move a segment that starts or ends at a next to c, in either orientation
+            for length in range(1, SEGMENT_LENGTH + 1):
+                for s in {p, p - length + 1}:
+                    e = s + length - 1
+                    if s < 1 or e > last or s <= q <= e:
+                        continue
+                    removed = cost(s - 1) + cost(e)
+                    joined = link(route[s - 1], at(e + 1))
+                    for u in (q - 1, q):
+                        if u == s - 1 or u == e or u > last:
+                            continue
+                        # a sits next to c: first after c when the gap is (c, next), last before c otherwise
+                        if u == q:
+                            reverse = route[s] != a
+                        else:
+                            reverse = route[e] != a
+                        first, tail = (route[e], route[s]) if reverse else (route[s], route[e])
+                        evaluated += 1
+                        delta = (joined + d(route[u], first) + link(tail, at(u + 1))
+                                 - removed - cost(u))
+                        if delta < best_delta:
+                            segment = (e, s) if reverse else (s, e)
+                            if u < s:
+                                pieces = ((0, u), segment, (u + 1, s - 1), (e + 1, end))
+                            else:
+                                pieces = ((0, s - 1), (e + 1, u), segment, (u + 1, end))
+                            if not on_time(piece for piece in pieces if piece is segment or piece[0] <= piece[1]):
+                                continue
+                            best_delta, best_move = delta, ('relocate', s, e, u, reverse)
+
+        # 3-opt segment exchange, swap i..j and j+1..k: (i-1, i), (j, j+1), (k, k+1)
+        # become (i-1, j+1), (k, i), (j, k+1) with k a neighbor of a (at i)
+        i = p
+        for e_node in neighbors[a]:
+            k = pos.get(e_node)
+            if k is None or e_node == hub or k <= i:
+                continue
+            for g in neighbors[route[i - 1]]:
+                j1 = pos.get(g)
+                if j1 is None or g == hub or not i < j1 <= k:
+                    continue
+                j = j1 - 1
+                evaluated += 1
+                delta = (d(route[i - 1], route[j1]) + d(route[k], route[i]) + link(route[j], at(k + 1))
+                         - cost(i - 1) - cost(j) - cost(k))
+                if delta < best_delta and on_time(((0, i - 1), (j1, k), (i, j), (k + 1, end))):
+                    best_delta, best_move = delta, ('exchange', i, j, k)
+
+        if best_move is None:
+            continue
+
+        # O(n) - apply the best move and wake up the stops whose edges changed
+        kind = best_move[0]
+        if kind == 'reverse':
+            _, x, y = best_move
+            touched = {route[x - 1], route[x], route[y], at(y + 1)}
+            route[x:y + 1] = route[x:y + 1][::-1]
+        elif kind == 'relocate':
+            _, s, e, u, reverse = best_move
+            touched = {route[s - 1], route[s], route[e], at(e + 1), route[u], at(u + 1)}
+            segment = route[s:e + 1]
+            if reverse:
+                segment.reverse()
+            del route[s:e + 1]
+            insert_at = u - len(segment) + 1 if u > e else u + 1
+            route[insert_at:insert_at] = segment
+        else:
+            _, i, j, k = best_move
+            touched = {route[i - 1], route[i], route[j], route[j + 1], route[k], at(k + 1)}
+            route[i:k + 1] = route[j + 1:k + 1] + route[i:j + 1]
+
+        reindex()
+        touched.add(a)
+        for node in touched:
+            if node is not None and node in pos and node not in queued:
+                active.append(node)
+                queued.add(node)
+
+    stats.count('route candidates', evaluated)
+    return route
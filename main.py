@@ -1,13 +1,53 @@
 # Created by: Shelby Sanchez-Herrera | Student ID: 012272973
-from helper import dispatch, package_hashTable, initial_trucks
+import argparse
+import sys
+
+from helper import load_dispatch, package_hashTable, initial_trucks
 from interface import interface_main
+from queries import REPORTS, parse_time, report_rows, write_report
 
 """
  This runs the program
  It ensures it runs only when executed and not when simply imported
 
+ With no arguments the interactive menu starts. Batch mode answers every --at time in one process and
+ prints CSV or JSON, e.g.: python main.py --at now --report trucks --format json
+                           python main.py --at 9:00am 10:30am --packages 9 25 --format csv
+                           python main.py --at 8:00 17:00 --every 1 --report fleet
+
  Created by: Shelby Sanchez-Herrera | Student ID: 012272973
 """
+
+
+def query_time(text):
+    try:
+        return parse_time(text)
+    except ValueError as error:
+        raise argparse.ArgumentTypeError(str(error))
+
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(description='WGU Routing Postal Service status reports')
+    parser.add_argument('--at', nargs='+', type=query_time, metavar='TIME',
+                        help="query times: 'now', HH:MM am/pm, HH:MM or HH:MM:SS (no --at starts the menu)")
+    parser.add_argument('--report', choices=REPORTS, default='packages')
+    parser.add_argument('--packages', nargs='+', type=int, metavar='ID', help='only these packages')
+    parser.add_argument('--format', choices=('csv', 'json'), default='csv')
+    parser.add_argument('--every', type=int, metavar='MINUTES',
+                        help='playback: every MINUTES from the first to the last --at time')
+    return parser.parse_args(argv)
+
+
 if __name__ == "__main__":
-    dispatch(initial_trucks)
-    interface_main(package_hashTable, initial_trucks)
+    args = parse_args(sys.argv[1:])
+    # reuses the saved dispatch plan while the csvs are unchanged, otherwise dispatches and saves it
+    load_dispatch(initial_trucks)
+    if args.at:
+        if args.every:
+            args.at = list(range(args.at[0], args.at[-1] + 1, args.every * 60))
+        try:
+            write_report(report_rows(args.report, args.at, args.packages), args.format)
+        except LookupError as error:
+            sys.exit(f'main.py: error: {error}')
+    else:
+        interface_main(package_hashTable, initial_trucks)
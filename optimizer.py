@@ -0,0 +1,217 @@
+import random
+import time
+from concurrent.futures import ProcessPoolExecutor
+from math import inf
+
+from DispatchStats import DispatchStats
+from RouteCache import RouteCache
+
+# read-only distance matrix of a pool worker, set once by _init_worker
+_worker_distances = None
+
+
+class OptimizerResult:
+    """
+    Best route found by the optimizer and how it improved over time
+    """
+
+    def __init__(self):
+        """
+        O(1) - Initializing the result
+        - route: List of location ids, best route found
+        - distance: Float, length of the best route
+        - on_time: Boolean, the best route meets every deadline
+        - restarts: Integer, number of restarts that ran
+        - history: List of (elapsed seconds, restart, distance), one entry per improvement
+        - stopped_by: String, which rule ended the search ('iterations', 'time' or 'converged')
+        - warm_start: Boolean, the search started from a cached route
+        """
+        self.route = []
+        self.distance = inf
+        self.on_time = False
+        self.restarts = 0
+        self.history = []
+        self.stopped_by = None
+        self.warm_start = False
+
+    def record(self, route, distance, elapsed, on_time=True):
+        """
+        O(1) - Keeps the route if it beats the best one so far, a route on time beats any late route
+
+        returns boolean if the route was an improvement
+        """
+        if (on_time, -distance) > (self.on_time, -self.distance + 1e-9):
+            self.route = route
+            self.distance = distance
+            self.on_time = on_time
+            self.history.append((elapsed, self.restarts, distance))
+            return True
+        return False
+
+
+def optimize_route(truck, distances, locations, algorithm, iterations=100, time_budget=None, seed=None,
+                   patience=None, cache=None, cache_key=None, stats=DispatchStats.OFF):
+    """
+    O(r * n^3) - Multi-start route optimization for a single truck
+    - algorithm: local search run on each restart, called as algorithm(truck, distances, locations, rng)
+    - iterations: maximum number of restarts, None for no limit (needs a time_budget)
+    - time_budget: wall-clock seconds to spend, None for no limit
+    - seed: seeds the random restarts so results are reproducible
+    - patience: stop early after this many restarts in a row without an improvement
+    - cache / cache_key: RouteCache and the fingerprint of this truck's problem, the best known route is
+      the starting best (so restarts only have to beat it) and an on-time result is stored back
+    - stats: DispatchStats, counts restarts (improved, late) and records each restart's miles as a histogram
+
+    returns OptimizerResult
+    """
+    if iterations is None and time_budget is None:
+        raise ValueError('An iteration or time budget is required')
+
+    rng = random.Random(seed)
+    histogram = f'restart miles truck {truck.id}'
+    windows = truck.time_windows()
+    result = OptimizerResult()
+    start = time.perf_counter()
+    stale = 0
+    if cache is not None:
+        _warm_start(result, cache, cache_key, distances, windows)
+
+    while True:
+        if iterations is not None and result.restarts >= iterations:
+            result.stopped_by = 'iterations'
+            break
+        if time_budget is not None and time.perf_counter() - start >= time_budget:
+            result.stopped_by = 'time'
+            break
+        if patience is not None and stale >= patience:
+            result.stopped_by = 'converged'
+            break
+
+        route = algorithm(truck, distances, locations, rng)
+        distance = distances.route_length(route)
+        on_time = windows.route_times(route, distances).feasible()
+        improved = result.record(route, distance, time.perf_counter() - start, on_time)
+        stale = 0 if improved else stale + 1
+        result.restarts += 1
+        if stats:
+            stats.count('restarts')
+            stats.count('restarts improved', improved)
+            stats.count('restarts late', not on_time)
+            stats.observe(histogram, distance)
+
+    stats.count('warm starts', result.warm_start)
+    if cache is not None and result.on_time:
+        cache.put(cache_key, result.route, result.distance)
+    return result
+
+
+def _warm_start(result, cache, key, distances, windows):
+    """
+    O(n) - Seeds a result with the cached route of a problem, if there is one
+    """
+    entry = cache.get(key)
+    if entry is not None:
+        route, distance = entry
+        on_time = windows is None or windows.route_times(route, distances).feasible()
+        result.record(route, distance, 0.0, on_time)
+        result.warm_start = True
+
+
+def optimize_routes_parallel(problems, distances, search, workers, iterations=100, time_budget=None, seed=None,
+                             patience=None, cache=None, stats=DispatchStats.OFF):
+    """
+    O(r * n^3 / workers) - Multi-start route optimization for several trucks across a process pool
+    - problems: List of (stops, start_location, closed, windows), one per truck, windows may be None
+    - search: top-level function called as search(stops, start_location, closed, distances, rng, windows)
+    - workers: Integer, number of worker processes
+    - iterations, time_budget, seed, patience: as in optimize_route, but every truck gets the whole
+      time_budget since they run side by side, and patience applies within each worker's batch
+    - cache: RouteCache, warm-starts each truck from its best known route and stores on-time results
+    - stats: DispatchStats, counts restarts and records the best miles of every worker batch as a histogram
+
+    The distance matrix is sent to each worker once when the pool starts (inherited on fork),
+    and workers only send back a route, its length and how many restarts they ran.
+
+    returns list of OptimizerResult, one per truck
+    """
+    if iterations is None and time_budget is None:
+        raise ValueError('An iteration or time budget is required')
+
+    # split every truck's restarts into batches so all of the workers stay busy
+    batches = max(1, workers // len(problems)) if iterations is None else max(1, min(iterations, workers))
+    deadline = time.time() + time_budget if time_budget is not None else None
+    results = [OptimizerResult() for _ in problems]
+    start = time.perf_counter()
+    if cache is not None:
+        keys = [RouteCache.key(*problem[:3], distances, problem[3]) for problem in problems]
+        for result, key, problem in zip(results, keys, problems):
+            _warm_start(result, cache, key, distances, problem[3])
+
+    with ProcessPoolExecutor(workers, initializer=_init_worker, initargs=(distances,)) as executor:
+        futures = []
+        for i, problem in enumerate(problems):
+            for batch in range(batches):
+                restarts = None
+                if iterations is not None:
+                    restarts = iterations // batches + (1 if batch < iterations % batches else 0)
+                batch_seed = f'{seed}:{i}:{batch}' if seed is not None else None
+                future = executor.submit(_run_restarts, search, problem, restarts, deadline, batch_seed, patience)
+                futures.append((i, future))
+
+        # collected in submission order so a seeded run always keeps the same route on ties
+        for i, future in futures:
+            result = results[i]
+            route, distance, on_time, restarts, stopped_by = future.result()
+            result.record(route, distance, time.perf_counter() - start, on_time)
+            result.restarts += restarts
+            stats.count('restarts', restarts)
+            stats.observe(f'batch miles problem {i}', distance)
+            if result.stopped_by is None or stopped_by == 'time':
+                result.stopped_by = stopped_by
+
+    stats.count('warm starts', sum(result.warm_start for result in results))
+    if cache is not None:
+        for result, key in zip(results, keys):
+            if result.on_time:
+                cache.put(key, result.route, result.distance)
+    return results
+
+
+def _init_worker(distances):
+    """
+    O(1) - Stores the read-only distance matrix in a pool worker
+    """
+    global _worker_distances
+    _worker_distances = distances
+
+
+def _run_restarts(search, problem, restarts, deadline, seed, patience):
+    """
+    O(r * n^3) - Runs one batch of restarts inside a pool worker
+
+    returns the best route, its length, if it is on time, the restarts that ran and which rule ended the batch
+    """
+    stops, start_location, closed, windows = problem
+    rng = random.Random(seed)
+    best = OptimizerResult()
+    ran = stale = 0
+
+    while True:
+        if restarts is not None and ran >= restarts:
+            stopped_by = 'iterations'
+            break
+        # a batch always runs at least once so every truck gets a route
+        if deadline is not None and ran and time.time() >= deadline:
+            stopped_by = 'time'
+            break
+        if patience is not None and stale >= patience:
+            stopped_by = 'converged'
+            break
+
+        route = search(stops, start_location, closed, _worker_distances, rng, windows)
+        distance = _worker_distances.route_length(route)
+        on_time = windows is None or windows.route_times(route, _worker_distances).feasible()
+        stale = 0 if best.record(route, distance, 0.0, on_time) else stale + 1
+        ran += 1
+
+    return best.route, best.distance, best.on_time, ran, stopped_by
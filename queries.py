@@ -0,0 +1,265 @@
+"""
+ Headless queries over a finished dispatch
+
+ Answers "what is the state at time T" for packages, trucks and the whole fleet as plain data objects,
+ without printing, prompting or changing any package. Times are seconds since midnight, or a time / datetime.
+ The interactive interface and the batch report mode (python main.py --at ...) are both built on these.
+"""
+from datetime import datetime
+import csv
+import json
+import sys
+
+from FleetSimulator import FleetSimulator
+from helper import delivery_timeline, initial_trucks, load_distance_csv, package_hashTable
+from Package import Package
+from Timeline import seconds
+
+TIME_FORMATS = ('%I:%M %p', '%I:%M%p', '%H:%M', '%H:%M:%S')
+REPORTS = ('packages', 'trucks', 'fleet')
+
+
+class PackageState:
+    """
+    A package at a point in time
+    """
+    __slots__ = ('id', 'address', 'city', 'state', 'zip', 'weight', 'deadline', 'notes', 'truck', 'status',
+                 'delivery_time', 'time')
+
+    def __init__(self, parcel, moment, status):
+        """
+        O(1) - Snapshot of a package
+        - moment: Integer, seconds since midnight of the query
+        - deadline, delivery_time: Integers, seconds since midnight (delivery_time is expected until delivered)
+        - truck: Integer truck id, None if not loaded
+        """
+        corrected_at = parcel.constraint.corrected_at
+        if corrected_at is not None and moment >= corrected_at:
+            row = Package.CORRECTED_ADDRESS
+        else:
+            row = Package.addresses.rows[parcel.address_id]
+        self.address, self.city, self.state, self.zip = row
+        self.id = parcel.id
+        self.weight = parcel.weight
+        self.deadline = parcel.deadline_seconds
+        self.notes = parcel.notes
+        self.truck = parcel.truck.id if parcel.truck is not None else None
+        self.status = status
+        self.delivery_time = parcel.delivery_seconds
+        self.time = moment
+
+    def to_dict(self):
+        """
+        O(1) - The state as a flat dictionary, times as HH:MM:SS
+        """
+        return {'time': clock(self.time), 'id': self.id, 'address': self.address, 'city': self.city,
+                'state': self.state, 'zip': self.zip, 'weight': self.weight, 'deadline': clock(self.deadline),
+                'notes': self.notes, 'truck': self.truck, 'status': self.status,
+                'delivery_time': clock(self.delivery_time)}
+
+
+class TruckState:
+    """
+    A truck at a point in time
+    """
+    __slots__ = ('id', 'driver', 'departure', 'packages', 'location_id', 'location', 'miles', 'completed', 'time')
+
+    def __init__(self, truck, moment, location_id, location, miles, completed):
+        """
+        O(n) - Snapshot of a truck
+        - departure: Integer, seconds since midnight the truck leaves the hub
+        - packages: List of package ids assigned to the truck, sorted
+        - location_id / location: latest stop (the previous one while en route) and its address
+        - miles: Float, miles driven so far
+        - completed: Boolean, the truck has finished its route
+        """
+        self.id = truck.id
+        self.driver = truck.driver
+        self.departure = round(seconds(truck.departure_time))
+        self.packages = sorted(parcel.id for parcel in truck.packages)
+        self.location_id = location_id
+        self.location = location
+        self.miles = miles
+        self.completed = completed
+        self.time = moment
+
+    def to_dict(self):
+        """
+        O(n) - The state as a flat dictionary, times as HH:MM:SS and packages as a space separated string
+        """
+        return {'time': clock(self.time), 'id': self.id, 'driver': self.driver, 'departure': clock(self.departure),
+                'location': self.location, 'miles': round(self.miles, 1), 'completed': self.completed,
+                'packages': ' '.join(map(str, self.packages))}
+
+
+class FleetState:
+    """
+    Every truck at a point in time
+    """
+    __slots__ = ('time', 'trucks', 'total_miles')
+
+    def __init__(self, moment, trucks):
+        """
+        O(1) - Snapshot of the fleet
+        - trucks: List of TruckState
+        - total_miles: Float, miles driven so far by every truck
+        """
+        self.time = moment
+        self.trucks = trucks
+        self.total_miles = sum(truck.miles for truck in trucks)
+
+    def to_dict(self):
+        """
+        O(t) - The state as a flat dictionary, the total miles, trucks done, then the location and miles of each truck
+        """
+        row = {'time': clock(self.time), 'total_miles': round(self.total_miles, 1),
+               'completed': sum(truck.completed for truck in self.trucks)}
+        for truck in self.trucks:
+            row[f'truck_{truck.id}_location'] = truck.location
+            row[f'truck_{truck.id}_miles'] = round(truck.miles, 1)
+        return row
+
+
+def package_at(package_id, moment, package_table=package_hashTable, timeline=delivery_timeline):
+    """
+    O(log n) - State of one package at a time
+
+    returns PackageState, or None if there is no package with that id
+    """
+    parcel = package_table.lookup(package_id)
+    if parcel is None:
+        return None
+    moment = seconds(moment)
+    return PackageState(parcel, moment, _status(parcel, moment, timeline))
+
+
+def status_at(moment, package_table=package_hashTable, timeline=delivery_timeline):
+    """
+    O(n log n) - State of every package at a time
+
+    returns list of PackageState in package id order
+    """
+    moment = seconds(moment)
+    return [PackageState(parcel, moment, _status(parcel, moment, timeline))
+            for parcel in sorted(package_table, key=lambda parcel: parcel.id)]
+
+
+def fleet_at(moment, trucks=initial_trucks, distances=None):
+    """
+    O(t log n) - State of every truck at a time
+    - Bisects the delivery timeline (see Truck.execute_route)
+
+    returns FleetState
+    """
+    moment = seconds(moment)
+    distances = distances if distances is not None else load_distance_csv()
+    states = []
+    for truck in trucks:
+        location_id, miles = truck.execute_route(moment, distances)
+        times = truck.timeline.trucks[truck.id][0]
+        completed = bool(truck.route) and moment >= times[-1]
+        states.append(TruckState(truck, moment, location_id, distances.locations[location_id], miles, completed))
+    return FleetState(moment, states)
+
+
+def report_rows(report, moments, package_ids=None):
+    """
+    O(q * n log n) - Rows of a report at every query time, trucks and fleet reports are one playback sweep
+    - report: 'packages' (one row per package, or per id in package_ids), 'trucks' (one row per truck)
+      or 'fleet' (one row per time)
+
+    returns list of dictionaries
+    """
+    if report not in REPORTS:
+        raise ValueError(f'Unknown report: {report}, expected one of {", ".join(REPORTS)}')
+    if report == 'trucks':
+        return [truck.to_dict() for fleet in fleet_playback(moments) for truck in fleet.trucks]
+    if report == 'fleet':
+        return [fleet.to_dict() for fleet in fleet_playback(moments)]
+
+    rows = []
+    for moment in moments:
+        if package_ids is None:
+            states = status_at(moment)
+        else:
+            states = [package_at(package_id, moment) for package_id in package_ids]
+            missing = [package_id for package_id, state in zip(package_ids, states) if state is None]
+            if missing:
+                raise LookupError(f'No package with id {missing[0]}')
+        rows.extend(state.to_dict() for state in states)
+    return rows
+
+
+def write_report(rows, output_format='csv', output=sys.stdout):
+    """
+    O(n) - Writes report rows as CSV with a header, or as a JSON list
+    """
+    if output_format == 'json':
+        json.dump(rows, output, indent=2)
+        output.write('\n')
+        return
+    if not rows:
+        return
+    writer = csv.DictWriter(output, fieldnames=list(rows[0]), lineterminator='\n')
+    writer.writeheader()
+    writer.writerows(rows)
+
+
+def fleet_playback(moments, trucks=initial_trucks, distances=None):
+    """
+    O(q log q + t * (n + q)) - State of every truck at many times in one sweep (see FleetSimulator)
+
+    returns list of FleetState, in the order of moments
+    """
+    distances = distances if distances is not None else load_distance_csv()
+    moments = [seconds(moment) for moment in moments]
+    simulator = FleetSimulator(trucks, distances)
+    positions = simulator.simulate(moments)
+    fleets = []
+    for q, moment in enumerate(moments):
+        states = []
+        for truck in trucks:
+            at, miles = positions[truck.id]
+            completed = bool(truck.route) and moment >= simulator.finished(truck.id)
+            states.append(TruckState(truck, moment, at[q], distances.locations[at[q]], miles[q], completed))
+        fleets.append(FleetState(moment, states))
+    return fleets
+
+
+def parse_time(text):
+    """
+    O(1) - Seconds since midnight of 'now', a 12-hour time (10:30 am) or a 24-hour time (10:30, 10:30:00)
+
+    returns Integer
+    """
+    text = text.strip()
+    if text.lower() == 'now':
+        return round(seconds(datetime.now()))
+    for time_format in TIME_FORMATS:
+        try:
+            return round(seconds(datetime.strptime(text.upper(), time_format)))
+        except ValueError:
+            pass
+    raise ValueError(f'Not a time: {text!r}, use HH:MM am/pm, HH:MM or HH:MM:SS')
+
+
+def clock(moment):
+    """
+    O(1) - HH:MM:SS of seconds since midnight
+    """
+    moment = round(moment)
+    return f'{moment // 3600:02d}:{moment // 60 % 60:02d}:{moment % 60:02d}'
+
+
+def _status(parcel, moment, timeline):
+    """
+    O(log n) - Status of a package, from the delivery timeline when it has the package
+    (the dispatch and delivery times when it is not on the timeline)
+    """
+    if timeline is not None and parcel.id in timeline.packages:
+        return timeline.package_status(parcel.id, moment)
+    if moment < parcel.dispatch_seconds:
+        return "At the hub"
+    if moment < parcel.delivery_seconds:
+        return "En route"
+    return "Delivered"
@@ -0,0 +1,437 @@
+"""
+ Inter-truck rebalancing for late packages
+
+ While a truck has late packages, stops are moved between it and the other trucks with relocate,
+ swap* and cross-exchange moves. Stops holding one co-delivery group only move together, as one
+ group relocate of their combined size. Every candidate is first priced with an O(1) insertion-cost
+ estimate, the cheapest ones are built and checked for lateness, and only the stops around the
+ change are re-optimized. Each accepted move records which late packages it fixed.
+"""
+import heapq
+from math import inf
+
+from DeliveryGroups import DeliveryGroups
+from DispatchStats import DispatchStats
+from local_search import NEIGHBORS, improve_route, neighbor_lists
+from Timeline import seconds
+
+# candidate moves built and checked per round, cheapest estimate first
+TRIALS = 200
+# longest run of stops exchanged by a cross-exchange move
+SEGMENT_LENGTH = 2
+# insertion positions kept per stop for swap*
+INSERTIONS = 3
+
+
+class RebalanceMove:
+    """
+    One accepted move between two trucks
+    """
+
+    def __init__(self, kind, source, target, moved, returned, fixed, delta):
+        """
+        O(1) - Initializing the move
+        - kind: String, 'relocate', 'group relocate', 'swap*' or 'cross-exchange'
+        - source: Integer, id of the truck that had late packages
+        - target: Integer, id of the truck the stops were moved to
+        - moved: List of package ids moved from source to target
+        - returned: List of package ids moved from target to source
+        - fixed: List of package ids that were late and now are on time
+        - delta: Float, change in total miles of both trucks
+        """
+        self.kind = kind
+        self.source = source
+        self.target = target
+        self.moved = moved
+        self.returned = returned
+        self.fixed = fixed
+        self.delta = delta
+
+    def __str__(self):
+        returned = f', packages {self.returned} truck {self.target} -> {self.source}' if self.returned else ''
+        return (f'{self.kind}: packages {self.moved} truck {self.source} -> {self.target}{returned}, '
+                f'fixed late packages {self.fixed} ({self.delta:+.1f} miles)')
+
+
+def rebalance(trucks, distances, truck3, max_moves=20, stats=DispatchStats.OFF):
+    """
+    O(m * (t * n^2 + TRIALS * n)) - Moves stops between trucks until no package is late
+    - A stop only moves if every package there is allowed on the other truck (see Constraint.allows),
+      and together with every stop holding a package of the same co-delivery group
+    - A move is kept if it lowers the number of late packages in the fleet, counting the trucks whose departure
+      depends on the moved routes (the third truck leaves once the first one is back, see Truck.on_time)
+    - Moved packages take their new truck and its departure, every package's dispatch time is refreshed at the end
+    - Deterministic, the same trucks always get the same moves
+    - stats: DispatchStats, times the on_time checks and counts candidates and moves evaluated, accepted
+      and reverted (evaluated but not kept)
+
+    returns list of RebalanceMove, in the order they were made
+    """
+    nodes = tuple(sorted({location for truck in trucks for location in truck.route}))
+    groups = DeliveryGroups(parcel for truck in trucks for parcel in truck.packages)
+    neighbors = neighbor_lists(distances, nodes, NEIGHBORS * len(trucks))
+    # the third truck leaves at this time, or later once the first truck is back
+    departure3 = truck3.departure_time
+    moves = []
+
+    while len(moves) < max_moves:
+        # on_time refreshes delivery times (and the third truck's departure)
+        with stats.stage('on_time'):
+            late_trucks = _refresh(trucks, distances, truck3, departure3)
+        if not late_trucks:
+            break
+
+        move = None
+        for source in late_trucks:
+            for target in trucks:
+                if target is not source:
+                    move = _improve_pair(source, target, trucks, truck3, departure3, distances, neighbors, groups,
+                                         stats)
+                    if move is not None:
+                        break
+            if move is not None:
+                break
+
+        if move is None:
+            break
+        moves.append(move)
+
+    with stats.stage('on_time'):
+        _refresh(trucks, distances, truck3, departure3)
+    for truck in trucks:
+        for parcel in truck.packages:
+            parcel.dispatch_seconds = round(seconds(truck.departure_time))
+    return moves
+
+
+def _refresh(trucks, distances, truck3, departure3):
+    """
+    O(n) - Refreshes every truck's delivery times in truck order, the third truck's departure is recomputed
+    from departure3 so a shorter first route lets it leave earlier again
+
+    returns list of trucks with late packages
+    """
+    truck3.departure_time = departure3
+    return [truck for truck in trucks if not truck.on_time(distances, truck3)]
+
+
+def late_packages(route, packages, departure_time, mph, distances):
+    """
+    O(n) - Packages delivered after their deadline when a truck drives a route
+
+    returns set of package ids
+    """
+    arrival = {}
+    time = seconds(departure_time)
+    for current_location, next_location in zip(route, route[1:]):
+        time += distances.d(current_location, next_location) / mph * 3600
+        arrival.setdefault(next_location, time)
+
+    return {parcel.id for parcel in packages
+            if arrival.get(parcel.location_id, inf) > parcel.deadline_seconds + 0.5}
+
+
+def fleet_late(trucks, distances, truck3, departure3, routes=None, loads=None):
+    """
+    O(n) - Packages delivered after their deadline anywhere in the fleet
+    - routes / loads: Dictionaries of truck -> route / packages to use instead of the truck's own
+    - The third truck leaves at departure3, or once the first truck is back at the hub if that is later
+      (the same rule as Truck.on_time, trucks are timed in order)
+
+    returns set of package ids
+    """
+    routes = routes or {}
+    loads = loads or {}
+    late = set()
+    for truck in trucks:
+        route = routes.get(truck, truck.route)
+        departure = seconds(departure3 if truck is truck3 else truck.departure_time)
+        late |= late_packages(route, loads.get(truck, truck.packages), departure, truck.mph, distances)
+
+        if truck.id == 1 and truck3 is not truck and route and route[0] in route[1:]:
+            back = route.index(route[0], 1)
+            returned = departure + distances.route_length(route[:back + 1]) / truck.mph * 3600
+            departure3 = max(seconds(departure3), returned)
+    return late
+
+
+def _improve_pair(source, target, trucks, truck3, departure3, distances, neighbors, groups, stats):
+    """
+    O(n^2 + TRIALS * n) - Best move of stops between a truck with late packages and another truck
+    - Lateness is counted over the whole fleet (see fleet_late)
+
+    returns the RebalanceMove that was made, or None
+    """
+    late_before = fleet_late(trucks, distances, truck3, departure3)
+
+    candidates = _candidates(source, target, distances, neighbors, groups)
+    trials = heapq.nsmallest(TRIALS, candidates, key=lambda candidate: candidate[0])
+    stats.count('rebalance candidates', len(candidates))
+    for _, kind, out_stops, in_stops, after_source, after_target in trials:
+        out_stops, in_stops = list(out_stops), list(in_stops)
+        out_parcels = [parcel for parcel in source.packages if parcel.location_id in out_stops]
+        in_parcels = [parcel for parcel in target.packages if parcel.location_id in in_stops]
+        source_parcels = [parcel for parcel in source.packages if parcel not in out_parcels] + in_parcels
+        target_parcels = [parcel for parcel in target.packages if parcel not in in_parcels] + out_parcels
+
+        source_route = _exchange(source.route, out_stops, in_stops, after_source)
+        if kind == 'group relocate':
+            target_route = _insert_all(target.route, out_stops, distances.d)
+        else:
+            target_route = _exchange(target.route, in_stops, out_stops, after_target)
+
+        stats.count('rebalance moves evaluated')
+        late_after = None
+        # O(n) - repair only around the stops that changed, keeping deadlines the route already meets
+        for repair in (False, True):
+            if repair:
+                touched = out_stops + in_stops + [after_source, after_target]
+                source_route = improve_route(source_route, distances, neighbors,
+                                             source.time_windows(source_parcels), touched)
+                target_route = improve_route(target_route, distances, neighbors,
+                                             target.time_windows(target_parcels), touched)
+            late = fleet_late(trucks, distances, truck3, departure3, {source: source_route, target: target_route},
+                              {source: source_parcels, target: target_parcels})
+            if late_after is None or len(late) <= len(late_after):
+                late_after = late
+                best_routes = (list(source_route), list(target_route))
+
+        if len(late_after) >= len(late_before):
+            stats.count('rebalance moves reverted')
+            continue
+
+        source_route, target_route = best_routes
+        delta = (distances.route_length(source_route) + distances.route_length(target_route)
+                 - distances.route_length(source.route) - distances.route_length(target.route))
+        for parcel in out_parcels:
+            source.unassign_package(parcel)
+        for parcel in in_parcels:
+            target.unassign_package(parcel)
+            _load(source, parcel)
+        for parcel in out_parcels:
+            _load(target, parcel)
+        for truck, route in ((source, source_route), (target, target_route)):
+            truck.route = route
+            truck.total_distance = distances.route_length(route)
+            truck.timeline = None
+
+        stats.count('rebalance moves accepted')
+        return RebalanceMove(kind, source.id, target.id, [parcel.id for parcel in out_parcels],
+                             [parcel.id for parcel in in_parcels], sorted(late_before - late_after), delta)
+
+    return None
+
+
+def _load(truck, parcel):
+    """
+    O(1) - Puts a moved package on a truck, with the truck's departure as its dispatch time
+    """
+    truck.assign_package(parcel)
+    parcel.assign_truck(truck)
+    parcel.dispatch_seconds = round(seconds(truck.departure_time))
+
+
+def _candidates(source, target, distances, neighbors, groups):
+    """
+    O(n^2) - Relocate, group relocate, swap* and cross-exchange candidates priced with O(1) insertion-cost estimates
+
+    returns list of (estimated miles added, kind, stops leaving source, stops leaving target,
+    stop in source to insert after, stop in target to insert after)
+    """
+    d = distances.d
+    capacity = source.max_capacity
+    source_route, target_route = source.route, target.route
+    source_stops, target_stops = set(source_route), set(target_route)
+    source_units, target_units = _units(source, target, groups), _units(target, source, groups)
+    source_count = {}
+    for parcel in source.packages:
+        source_count[parcel.location_id] = source_count.get(parcel.location_id, 0) + 1
+    target_count = {}
+    for parcel in target.packages:
+        target_count[parcel.location_id] = target_count.get(parcel.location_id, 0) + 1
+    candidates = []
+
+    # a stop only leaves a route when all of its packages leave, and only joins a route it is not already on
+    source_movable = [unit[0] for unit in source_units if len(unit) == 1 and unit[0] not in target_stops]
+    target_movable = [unit[0] for unit in target_units if len(unit) == 1 and unit[0] not in source_stops]
+
+    # group relocate: every stop of a co-delivery group goes to its cheapest position of the other truck
+    for unit in source_units:
+        if len(unit) == 1 or target_stops.intersection(unit):
+            continue
+        if len(target.packages) + sum(source_count[location] for location in unit) > capacity:
+            continue
+        delta = sum(_insertions(target_route, location, d)[0][0] - _removal(source_route, location, d)
+                    for location in unit)
+        candidates.append((delta, 'group relocate', unit, (), None, None))
+
+    # relocate: a stop of the late truck goes to the cheapest position of the other truck
+    target_insertions = {location: _insertions(target_route, location, d) for location in source_movable}
+    for location in source_movable:
+        if len(target.packages) + source_count[location] > capacity:
+            continue
+        cost, after = target_insertions[location][0]
+        candidates.append((cost - _removal(source_route, location, d), 'relocate', (location,), (), None, after))
+
+    # swap*: two stops trade trucks, each inserted at its best position in the other route without the stop it
+    # replaces (from its few cheapest insertion positions, or the gap the other stop leaves)
+    source_insertions = {location: _insertions(source_route, location, d) for location in target_movable}
+    for out_stop in source_movable:
+        for in_stop in target_movable:
+            load_source = len(source.packages) - source_count[out_stop] + target_count[in_stop]
+            load_target = len(target.packages) - target_count[in_stop] + source_count[out_stop]
+            if load_source > capacity or load_target > capacity:
+                continue
+            cost_in, after_source = _insertion_without(source_route, in_stop, out_stop,
+                                                       source_insertions[in_stop], d)
+            cost_out, after_target = _insertion_without(target_route, out_stop, in_stop,
+                                                        target_insertions[out_stop], d)
+            delta = (cost_in + cost_out - _removal(source_route, out_stop, d)
+                     - _removal(target_route, in_stop, d))
+            candidates.append((delta, 'swap*', (out_stop,), (in_stop,), after_source, after_target))
+
+    # cross-exchange: runs of up to SEGMENT_LENGTH consecutive stops trade places, a run of the other
+    # truck is only tried when it starts near the stop before the run it replaces
+    source_ok, target_ok = set(source_movable), set(target_movable)
+    target_position = {location: p for p, location in enumerate(target_route)}
+    for i in range(1, len(source_route)):
+        for length_out in range(1, SEGMENT_LENGTH + 1):
+            out_run = source_route[i:i + length_out]
+            if len(out_run) < length_out or not source_ok.issuperset(out_run):
+                break
+            before_out = source_route[i - 1]
+            after_out = source_route[i + length_out] if i + length_out < len(source_route) else None
+            for near in neighbors[before_out]:
+                j = target_position.get(near)
+                if j is None or j == 0:
+                    continue
+                before_in = target_route[j - 1]
+                for length_in in range(1, SEGMENT_LENGTH + 1):
+                    in_run = target_route[j:j + length_in]
+                    if len(in_run) < length_in or not target_ok.issuperset(in_run):
+                        break
+                    after_in = target_route[j + length_in] if j + length_in < len(target_route) else None
+                    load_out = sum(source_count[location] for location in out_run)
+                    load_in = sum(target_count[location] for location in in_run)
+                    if (len(source.packages) - load_out + load_in > capacity
+                            or len(target.packages) - load_in + load_out > capacity):
+                        continue
+                    delta = (d(before_out, in_run[0]) + _link(in_run[-1], after_out, d)
+                             + d(before_in, out_run[0]) + _link(out_run[-1], after_in, d)
+                             - d(before_out, out_run[0]) - _link(out_run[-1], after_out, d)
+                             - d(before_in, in_run[0]) - _link(in_run[-1], after_in, d))
+                    candidates.append((delta, 'cross-exchange', tuple(out_run), tuple(in_run),
+                                       before_out, before_in))
+
+    return candidates
+
+
+def _units(truck, other, groups):
+    """
+    O(n α(n)) - Stops of a truck that can move to another truck, every package there is allowed on it
+    - Stops holding packages of the same co-delivery group are joined into one unit (union-find over stops)
+
+    returns list of units, each a tuple of location ids in route order
+    """
+    departure = seconds(other.departure_time)
+    hub = truck.route[0] if truck.route else None
+    stops = DeliveryGroups()
+    group_stop = {}
+    pinned = set()
+    for parcel in truck.packages:
+        if parcel.constraint and not parcel.constraint.allows(other.id, departure):
+            pinned.add(parcel.location_id)
+        group = groups.find(parcel.id)
+        if group in group_stop:
+            stops.union(group_stop[group], parcel.location_id)
+        else:
+            group_stop[group] = parcel.location_id
+
+    units = {}
+    for location in dict.fromkeys(truck.route):
+        if location != hub:
+            units.setdefault(stops.find(location), []).append(location)
+    return [tuple(unit) for unit in units.values() if pinned.isdisjoint(unit)]
+
+
+def _link(a, b, d):
+    return d(a, b) if a is not None and b is not None else 0.0
+
+
+def _removal(route, location, d):
+    """
+    O(n) - Miles saved by taking a stop out of a route
+    """
+    p = route.index(location)
+    following = route[p + 1] if p + 1 < len(route) else None
+    return d(route[p - 1], location) + _link(location, following, d) - _link(route[p - 1], following, d)
+
+
+def _insertions(route, location, d):
+    """
+    O(n) - The cheapest positions to insert a stop into a route, cheapest first
+    - A closed route keeps the hub at the end, an open route can end at the new stop
+
+    returns list of up to INSERTIONS (miles added, stop to insert after)
+    """
+    closed = len(route) > 1 and route[-1] == route[0]
+    last_gap = len(route) - 2 if closed else len(route) - 1
+    costs = []
+    for p in range(last_gap + 1):
+        following = route[p + 1] if p + 1 < len(route) else None
+        costs.append((d(route[p], location) + _link(location, following, d) - _link(route[p], following, d),
+                      p, route[p]))
+    return [(cost, after) for cost, _, after in heapq.nsmallest(INSERTIONS, costs)]
+
+
+def _insertion_without(route, location, removed, insertions, d):
+    """
+    O(1) - Cheapest position for a stop in a route once another stop is removed from it
+    - Kept positions next to the removed stop are skipped, the gap it leaves behind is tried instead
+
+    returns (miles added, stop to insert after)
+    """
+    p = route.index(removed)
+    before = route[p - 1]
+    following = route[p + 1] if p + 1 < len(route) else None
+    best = (d(before, location) + _link(location, following, d) - _link(before, following, d), before)
+    for cost, after in insertions:
+        if after == removed or after == before:
+            continue
+        if cost < best[0]:
+            best = (cost, after)
+    return best
+
+
+def _insert_all(route, joining, d):
+    """
+    O(k n) - Route with each joining stop inserted, one after another, at its cheapest position
+
+    returns new list of location ids
+    """
+    route = list(route)
+    for location in joining:
+        _, after = _insertions(route, location, d)[0]
+        route.insert(route.index(after) + 1, location)
+    return route
+
+
+def _exchange(route, leaving, joining, after):
+    """
+    O(n) - Route with the leaving stops removed and the joining stops inserted, in order, after a stop
+
+    returns new list of location ids
+    """
+    leaving = set(leaving)
+    result = []
+    inserted = not joining
+    for location in route:
+        if location in leaving:
+            continue
+        result.append(location)
+        if not inserted and location == after:
+            result.extend(joining)
+            inserted = True
+    if not inserted:
+        result.extend(joining)
+    return result
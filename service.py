@@ -0,0 +1,368 @@
+"""
+ Local HTTP status service over the dispatch plan
+
+ Loads the dispatch plan once and answers status queries concurrently on one asyncio event loop (stdlib only):
+   GET  /packages/{id}?t=10:30   one package
+   GET  /packages?t=10:30        every package
+   GET  /trucks?t=10:30          every truck and the miles driven by the fleet
+   GET  /plan                    the inputs the served plan was built from, and if a replan is running
+   POST /replan                  re-plans in the background
+ t is optional (default now) and takes the same times as main.py --at. Responses are JSON.
+
+ Queries only read the served plan, a replan dispatches in a worker process and builds a new plan beside it,
+ then swaps it in. Readers are never blocked, a request already running finishes on the plan it started with.
+
+ Run: python service.py --port 8080 [--watch 60]
+ Load test: python service.py --bench --clients 50 --requests 20000 [--replan]
+"""
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from urllib.parse import parse_qs, urlsplit
+import argparse
+import asyncio
+import json
+import multiprocessing
+import random
+import sys
+import time
+
+import helper
+from DispatchPlan import DispatchPlan
+from PackageHt import PackageHt
+from queries import clock, fleet_at, package_at, parse_time, status_at
+from Timeline import Timeline
+from Truck import Truck
+
+REASONS = {200: 'OK', 202: 'Accepted', 400: 'Bad Request', 404: 'Not Found', 405: 'Method Not Allowed'}
+
+
+class Snapshot:
+    """
+    A dispatch plan being served, never changed once built (a replan builds a new one)
+    """
+    __slots__ = ('package_table', 'trucks', 'timeline', 'distances', 'inputs', 'built_at')
+
+    def __init__(self, package_table, trucks, timeline, distances, inputs):
+        """
+        O(1) - Initializing the snapshot
+        - package_table: PackageHt of the plan's packages
+        - trucks: List of routed trucks, each with its timeline
+        - timeline: Timeline built from the trucks
+        - inputs: String, hash of the csvs the plan was built from (see DispatchPlan.fingerprint)
+        """
+        self.package_table = package_table
+        self.trucks = trucks
+        self.timeline = timeline
+        self.distances = distances
+        self.inputs = inputs
+        self.built_at = datetime.now().isoformat(timespec='seconds')
+
+
+def build_snapshot(plan, truck_specs):
+    """
+    O(n) - Snapshot of a dispatch plan, with its own package table, trucks and timeline
+
+    returns Snapshot
+    """
+    distances = helper.load_distance_csv()
+    package_table = PackageHt()
+    helper.read_package_csv(helper.PACKAGE_CSV, distances, package_table)
+    trucks = plan.apply([Truck(*spec) for spec in truck_specs], package_table)
+    timeline = Timeline()
+    timeline.build(trucks, distances)
+    return Snapshot(package_table, trucks, timeline, distances, plan.inputs)
+
+
+def _replan(truck_specs):
+    """
+    O(dispatch) - Dispatches fresh trucks from the csvs, runs in a worker process
+
+    returns DispatchPlan
+    """
+    trucks = [Truck(*spec) for spec in truck_specs]
+    helper.dispatch(trucks)
+    inputs = DispatchPlan.fingerprint(helper.DISTANCE_CSV, helper.PACKAGE_CSV)
+    return DispatchPlan.from_trucks(inputs, trucks, helper.load_distance_csv())
+
+
+class StatusService:
+    """
+    Asyncio HTTP/1.1 server answering status queries from the current snapshot
+    """
+
+    def __init__(self, snapshot, truck_specs, executor, plan_path=None):
+        """
+        O(1) - Initializing the service
+        - truck_specs: List of (id, departure HH:MM:SS, driver), the trucks a replan dispatches
+        - executor: ProcessPoolExecutor a replan runs in
+        - plan_path: String, where a replanned plan is saved for the next start (None to not save)
+        - replanning: asyncio Task of the running replan, None when idle
+        """
+        self.snapshot = snapshot
+        self.truck_specs = truck_specs
+        self.executor = executor
+        self.plan_path = plan_path
+        self.replanning = None
+        self.replans = 0
+        self.replan_seconds = None
+        self.error = None
+
+    def start_replan(self):
+        """
+        O(1) - Starts a background replan unless one is running
+
+        returns boolean if a replan was started
+        """
+        if self.replanning is not None and not self.replanning.done():
+            return False
+        self.replanning = asyncio.get_running_loop().create_task(self.replan())
+        return True
+
+    async def replan(self):
+        """
+        Dispatches in the worker process, builds the new snapshot in a thread and swaps it in
+        - On failure the current snapshot keeps being served and the error is reported by /plan
+        """
+        loop = asyncio.get_running_loop()
+        start = time.perf_counter()
+        try:
+            plan = await loop.run_in_executor(self.executor, _replan, self.truck_specs)
+            snapshot = await loop.run_in_executor(None, build_snapshot, plan, self.truck_specs)
+            if self.plan_path is not None:
+                await loop.run_in_executor(None, plan.save, self.plan_path)
+        except Exception as error:
+            self.error = f'{type(error).__name__}: {error}'
+            print(f'replan failed: {self.error}', file=sys.stderr)
+            return
+        self.snapshot = snapshot
+        self.replans += 1
+        self.replan_seconds = time.perf_counter() - start
+        self.error = None
+
+    async def watch(self, interval):
+        """
+        Replans whenever the csvs stop matching the served plan, checked every interval seconds
+        """
+        loop = asyncio.get_running_loop()
+        while True:
+            await asyncio.sleep(interval)
+            inputs = await loop.run_in_executor(None, DispatchPlan.fingerprint, helper.DISTANCE_CSV,
+                                                helper.PACKAGE_CSV)
+            if inputs != self.snapshot.inputs:
+                self.start_replan()
+
+    def respond(self, method, target):
+        """
+        O(n log n) at most - Answers one request
+
+        returns status code and a JSON-serializable body
+        """
+        url = urlsplit(target)
+        parts = [part for part in url.path.split('/') if part]
+
+        if parts == ['replan']:
+            if method != 'POST':
+                return 405, {'error': 'Use POST /replan'}
+            return 202, {'started': self.start_replan(), 'replanning': True}
+        if method != 'GET':
+            return 405, {'error': f'{method} is not supported on {url.path}'}
+        if parts == ['plan']:
+            snapshot = self.snapshot
+            return 200, {'inputs': snapshot.inputs, 'built_at': snapshot.built_at, 'replans': self.replans,
+                         'replanning': self.replanning is not None and not self.replanning.done(),
+                         'replan_seconds': self.replan_seconds, 'error': self.error}
+
+        query = parse_qs(url.query)
+        try:
+            moment = parse_time(query['t'][0] if 't' in query else 'now')
+        except ValueError as error:
+            return 400, {'error': str(error)}
+
+        # one snapshot for the whole request, even if a replan swaps it meanwhile
+        snapshot = self.snapshot
+        if parts == ['packages']:
+            return 200, [state.to_dict() for state in status_at(moment, snapshot.package_table, snapshot.timeline)]
+        if len(parts) == 2 and parts[0] == 'packages':
+            state = None
+            if parts[1].isdecimal():
+                state = package_at(int(parts[1]), moment, snapshot.package_table, snapshot.timeline)
+            if state is None:
+                return 404, {'error': f'No package with id {parts[1]}'}
+            return 200, state.to_dict()
+        if parts == ['trucks']:
+            fleet = fleet_at(moment, snapshot.trucks, snapshot.distances)
+            return 200, {'time': clock(fleet.time), 'total_miles': round(fleet.total_miles, 1),
+                         'trucks': [truck.to_dict() for truck in fleet.trucks]}
+        return 404, {'error': f'No such path: {url.path}'}
+
+    async def handle(self, reader, writer):
+        """
+        Serves the requests of one connection, kept alive until the client closes it or asks to
+        """
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b'\r\n', b'\n', b''):
+                        break
+                    name, _, value = line.decode('latin-1').partition(':')
+                    headers[name.strip().lower()] = value.strip()
+                try:
+                    length = int(headers.get('content-length') or 0)
+                except ValueError:
+                    length = -1
+                if length > 0:
+                    await reader.readexactly(length)
+
+                request = request_line.decode('latin-1').split()
+                # the body can't be skipped without a valid length, so the connection is closed after the reply
+                if length < 0:
+                    status, body = 400, {'error': 'Malformed Content-Length header'}
+                    keep_alive = False
+                elif len(request) == 3:
+                    method, target, version = request
+                    try:
+                        status, body = self.respond(method, target)
+                    except ValueError as error:
+                        status, body = 400, {'error': str(error)}
+                    keep_alive = version == 'HTTP/1.1' and headers.get('connection', '').lower() != 'close'
+                else:
+                    status, body = 400, {'error': 'Malformed request line'}
+                    keep_alive = False
+
+                payload = json.dumps(body).encode()
+                writer.write(f'HTTP/1.1 {status} {REASONS[status]}\r\n'
+                             f'Content-Type: application/json\r\n'
+                             f'Content-Length: {len(payload)}\r\n'
+                             f'Connection: {"keep-alive" if keep_alive else "close"}\r\n\r\n'.encode() + payload)
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    async def serve(self, host, port):
+        """
+        Starts listening
+
+        returns asyncio Server
+        """
+        return await asyncio.start_server(self.handle, host, port)
+
+
+async def load_test(service, clients, requests, replan=False):
+    """
+    Load generator: clients keep-alive connections send a mix of package, all-package and truck queries
+    at random times of day against a service on localhost
+    - replan: also start a background replan with the first request, to measure reads while it runs
+
+    returns dictionary of throughput, latency percentiles and status counts
+    """
+    server = await service.serve('127.0.0.1', 0)
+    port = server.sockets[0].getsockname()[1]
+    package_ids = [state.id for state in status_at(0, service.snapshot.package_table, service.snapshot.timeline)]
+    rng = random.Random(1)
+    latencies = []
+    statuses = {}
+    during_replan = 0
+
+    async def client(count):
+        nonlocal during_replan
+        reader, writer = await asyncio.open_connection('127.0.0.1', port)
+        for _ in range(count):
+            t = f'{rng.randint(8, 16)}:{rng.randint(0, 59):02d}'
+            roll = rng.random()
+            if roll < 0.7:
+                path = f'/packages/{rng.choice(package_ids)}?t={t}'
+            elif roll < 0.9:
+                path = f'/trucks?t={t}'
+            else:
+                path = f'/packages?t={t}'
+            start = time.perf_counter()
+            writer.write(f'GET {path} HTTP/1.1\r\nHost: localhost\r\n\r\n'.encode())
+            status = int((await reader.readline()).split()[1])
+            length = 0
+            while True:
+                line = await reader.readline()
+                if line == b'\r\n':
+                    break
+                if line.lower().startswith(b'content-length:'):
+                    length = int(line.split(b':')[1])
+            await reader.readexactly(length)
+            latencies.append(time.perf_counter() - start)
+            statuses[status] = statuses.get(status, 0) + 1
+            if service.replanning is not None and not service.replanning.done():
+                during_replan += 1
+        writer.close()
+
+    start = time.perf_counter()
+    if replan:
+        service.start_replan()
+    await asyncio.gather(*(client(requests // clients + (1 if i < requests % clients else 0))
+                           for i in range(clients)))
+    seconds = time.perf_counter() - start
+    if service.replanning is not None:
+        await service.replanning
+    server.close()
+    await server.wait_closed()
+
+    latencies.sort()
+    return {'requests': len(latencies), 'clients': clients, 'seconds': seconds,
+            'requests_per_second': len(latencies) / seconds,
+            'p50_ms': latencies[len(latencies) // 2] * 1000, 'p90_ms': latencies[int(len(latencies) * 0.9)] * 1000,
+            'p99_ms': latencies[int(len(latencies) * 0.99)] * 1000, 'max_ms': latencies[-1] * 1000,
+            'statuses': statuses, 'served_during_replan': during_replan, 'replan_seconds': service.replan_seconds,
+            'replans': service.replans}
+
+
+async def run(service, args):
+    """
+    Serves until interrupted, or runs the load test
+    """
+    if args.bench:
+        report = await load_test(service, args.clients, args.requests, args.replan)
+        print(json.dumps(report, indent=2))
+        return
+
+    server = await service.serve(args.host, args.port)
+    if args.watch:
+        asyncio.get_running_loop().create_task(service.watch(args.watch))
+    print(f'Serving on http://{args.host}:{server.sockets[0].getsockname()[1]}')
+    async with server:
+        await server.serve_forever()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='HTTP status service over the dispatch plan')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8080)
+    parser.add_argument('--watch', type=float, help='replan when the csvs change, checked every WATCH seconds')
+    parser.add_argument('--bench', action='store_true', help='run the load generator against localhost and exit')
+    parser.add_argument('--clients', type=int, default=50, help='concurrent connections of the load generator')
+    parser.add_argument('--requests', type=int, default=20000, help='requests sent by the load generator')
+    parser.add_argument('--replan', action='store_true', help='replan in the background during the load test')
+    args = parser.parse_args()
+
+    truck_specs = [(truck.id, truck.departure_time.strftime('%H:%M:%S'), truck.driver)
+                   for truck in helper.initial_trucks]
+    helper.load_dispatch(helper.initial_trucks)
+    snapshot = Snapshot(helper.package_hashTable, helper.initial_trucks, helper.delivery_timeline,
+                        helper.load_distance_csv(), DispatchPlan.fingerprint(helper.DISTANCE_CSV, helper.PACKAGE_CSV))
+
+    # spawned, so the worker starts from a clean interpreter instead of a fork of the running event loop
+    with ProcessPoolExecutor(1, mp_context=multiprocessing.get_context('spawn')) as executor:
+        service = StatusService(snapshot, truck_specs, executor, None if args.bench else helper.PLAN_FILE)
+        try:
+            asyncio.run(run(service, args))
+        except KeyboardInterrupt:
+            pass
+
+
+if __name__ == "__main__":
+    main()
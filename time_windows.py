@@ -0,0 +1,208 @@
+"""
+ Deadline (time window) bookkeeping for route construction and local search
+
+ A route's arrival times are kept forward and its slack (latest feasible arrival) backward, so inserting
+ a stop or reconnecting a few route segments is checked for deadlines in O(1) before the move is taken.
+"""
+from math import inf
+import random
+
+EPSILON = 1e-6
+
+
+class TimeWindows:
+    """
+    Deadlines of one truck's stops, its departure time and speed
+    """
+
+    def __init__(self, deadlines, departure, mph):
+        """
+        O(1) - Initializing the time windows
+        - deadlines: Dictionary of location id -> seconds since midnight (earliest package deadline there)
+        - departure: Float, seconds since midnight the truck leaves the hub
+        - mph: Float, average speed
+        """
+        self.deadlines = deadlines
+        self.departure = departure
+        self.mph = mph
+
+    def deadline(self, location):
+        """
+        O(1) - Deadline of a location, inf when nothing there is due
+        """
+        return self.deadlines.get(location, inf)
+
+    def route_times(self, route, distances):
+        """
+        O(n) - Arrival and slack bookkeeping for a route
+
+        returns RouteTimes
+        """
+        return RouteTimes(route, distances, self)
+
+
+class RouteTimes:
+    """
+    Arrival times (forward) and latest feasible arrivals (backward) along one route
+    - Range-minimum tables over the route answer "latest start" of any forward or reversed segment in O(1)
+    """
+
+    def __init__(self, route, distances, windows):
+        """
+        O(n) - Initializing the bookkeeping
+        - elapsed: List, travel seconds from the hub to each position
+        - arrival: List, seconds since midnight the truck reaches each position
+        - latest: List, latest arrival at each position that keeps the rest of the route on time
+        - on_time: List of booleans, every deadline up to and including the position is met
+        """
+        self.route = route
+        self.distances = distances
+        self.windows = windows
+        size = len(route)
+        speed = windows.mph / 3600
+
+        self.due = [windows.deadline(location) for location in route]
+        self.elapsed = [0.0] * size
+        for p in range(1, size):
+            self.elapsed[p] = self.elapsed[p - 1] + distances.d(route[p - 1], route[p]) / speed
+        self.arrival = [windows.departure + elapsed for elapsed in self.elapsed]
+
+        self.on_time = [True] * size
+        met = True
+        for p in range(size):
+            met = met and self.arrival[p] <= self.due[p] + EPSILON
+            self.on_time[p] = met
+
+        self.latest = [inf] * size
+        if size:
+            self.latest[-1] = self.due[-1]
+        for p in range(size - 2, -1, -1):
+            self.latest[p] = min(self.due[p], self.latest[p + 1] - (self.elapsed[p + 1] - self.elapsed[p]))
+
+        self._tables = None
+
+    def feasible(self):
+        """
+        O(1) - Checks if every deadline on the route is met
+        """
+        return not self.route or self.on_time[-1]
+
+    def travel(self, a, b):
+        """
+        O(1) - Seconds to drive from location a to location b
+        """
+        return self.distances.d(a, b) / self.windows.mph * 3600
+
+    def insertion(self, location, p):
+        """
+        O(1) - Checks inserting a location between positions p and p + 1 (or after p at the open end)
+
+        returns boolean if every deadline is still met
+        """
+        if not self.on_time[p]:
+            return False
+        arrive = self.arrival[p] + self.travel(self.route[p], location)
+        if arrive > self.windows.deadline(location) + EPSILON:
+            return False
+        if p + 1 < len(self.route):
+            return arrive + self.travel(location, self.route[p + 1]) <= self.latest[p + 1] + EPSILON
+        return True
+
+    def pieces_feasible(self, pieces):
+        """
+        O(pieces) - Checks a route rebuilt from segments of this route
+        - pieces: List of (i, j) positions, i..j forward when i <= j and reversed when i > j
+
+        returns boolean if every deadline is met
+        """
+        route = self.route
+        time = self.windows.departure
+        previous = None
+        for i, j in pieces:
+            first, last = route[i], route[j]
+            if i <= j:
+                duration = self.elapsed[j] - self.elapsed[i]
+                # latest start of a forward segment: min(due - elapsed) over i..j, shifted back to i
+                if j == len(route) - 1:
+                    latest = self.latest[i]
+                else:
+                    latest = self._minimum(0, i, j) + self.elapsed[i]
+            else:
+                duration = self.elapsed[i] - self.elapsed[j]
+                # latest start of a reversed segment: min(due + elapsed) over j..i, shifted to i
+                latest = self._minimum(1, j, i) - self.elapsed[i]
+
+            if previous is not None:
+                time += self.travel(previous, first)
+            if time > latest + EPSILON:
+                return False
+            time += duration
+            previous = last
+        return True
+
+    def _minimum(self, table, i, j):
+        """
+        O(1) - Minimum of (due - elapsed) (table 0) or (due + elapsed) (table 1) over positions i..j
+        """
+        if self._tables is None:
+            self._tables = (_sparse_table([due - elapsed for due, elapsed in zip(self.due, self.elapsed)]),
+                            _sparse_table([due + elapsed for due, elapsed in zip(self.due, self.elapsed)]))
+        levels = self._tables[table]
+        level = (j - i + 1).bit_length() - 1
+        return min(levels[level][i], levels[level][j - (1 << level) + 1])
+
+
+def _sparse_table(values):
+    """
+    O(n log n) - Range-minimum table, level k holds the minimum of each window of 2^k values
+    """
+    levels = [values]
+    width = 1
+    while 2 * width <= len(values):
+        previous = levels[-1]
+        levels.append([min(previous[i], previous[i + width]) for i in range(len(values) - 2 * width + 1)])
+        width *= 2
+    return levels
+
+
+def construct_route(stops, start_location, closed, distances, windows, rng=random):
+    """
+    O(n^2) - Deadline-aware cheapest insertion
+    - Stops are inserted tightest deadline first, ties in random order so restarts differ
+    - Each stop goes to the cheapest position that passes the O(1) slack check,
+      or the cheapest position overall when no position keeps every deadline
+
+    returns the route
+    """
+    route = [start_location, start_location] if closed else [start_location]
+    order = sorted(stops, key=lambda stop: (windows.deadline(stop), rng.random()))
+
+    for stop in order:
+        _, p, _ = best_insertion(route, stop, windows.route_times(route, distances), closed)
+        route.insert(p + 1, stop)
+
+    return route
+
+
+def best_insertion(route, location, times, closed):
+    """
+    O(n) - Cheapest gap to insert a location into a route that passes the O(1) slack check (see RouteTimes.insertion),
+    or the cheapest gap overall when none keeps every deadline
+    - times: RouteTimes of the route
+    - closed: the last location stays at the end, so the gap after it is not tried
+
+    returns (miles added, position to insert after, boolean if every deadline is kept)
+    """
+    d = times.distances.d
+    last_gap = len(route) - 2 if closed else len(route) - 1
+    best = best_feasible = None
+    for p in range(last_gap + 1):
+        cost = d(route[p], location)
+        if p + 1 < len(route):
+            cost += d(location, route[p + 1]) - d(route[p], route[p + 1])
+        if best is None or cost < best[0]:
+            best = (cost, p, False)
+        if (best_feasible is None or cost < best_feasible[0]) and times.insertion(location, p):
+            best_feasible = (cost, p, True)
+
+    return best_feasible or best
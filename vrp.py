@@ -0,0 +1,468 @@
+"""
+ Capacity-constrained, multi-trip vehicle routing with hub reloads
+
+ Trips are built with the Clarke-Wright savings heuristic (restricted to each stop's nearest
+ neighbors), polished with the local search, and then scheduled onto drivers and trucks: a driver
+ can run any number of trips inside their availability window, reloading at the hub in between.
+ Package constraints are read from each package's Constraint: a co-delivery group rides one trip,
+ a pinned package's trip only runs on its truck, and a trip leaves once all of its packages are
+ at the hub (delayed) and their addresses are known (wrong address). Times are seconds since midnight.
+"""
+from collections import deque
+from datetime import datetime
+from math import inf
+import heapq
+
+from DeliveryGroups import DeliveryGroups
+from local_search import improve_route, neighbor_lists
+from time_windows import EPSILON, TimeWindows, best_insertion
+from Timeline import seconds
+
+
+class Driver:
+    """
+    A driver and the window they are available to drive
+    """
+
+    def __init__(self, id, start, end):
+        """
+        O(1) - Initializing the driver
+        - id: Integer, driver identifier
+        - start / end: Strings 'HH:MM:SS' or seconds since midnight, availability window
+        """
+        self.id = id
+        self.start = _clock_seconds(start)
+        self.end = _clock_seconds(end)
+
+
+class Trip:
+    """
+    One loop from the hub and back, carrying at most one truckload of packages
+    """
+
+    def __init__(self, route, package_ids, distance, ready=0, pinned_truck=None):
+        """
+        O(1) - Initializing the trip
+        - route: List of location ids, starting and ending at the hub
+        - package_ids: List of package ids carried on the trip
+        - distance: Float, miles driven
+        - ready: Integer, seconds since midnight every package is at the hub with a known address
+        - pinned_truck: Integer, the only truck that can run the trip, None for any
+        - driver / truck: ids of who drives it and on which truck, once scheduled
+        - start_time / end_time: Integers, seconds since midnight the trip leaves and returns to the hub, once scheduled
+        - delivery_times: Dictionary of package id -> seconds since midnight delivered, once scheduled
+        """
+        self.route = route
+        self.package_ids = package_ids
+        self.distance = distance
+        self.ready = ready
+        self.pinned_truck = pinned_truck
+        self.driver = None
+        self.truck = None
+        self.start_time = None
+        self.end_time = None
+        self.delivery_times = {}
+
+
+class FleetPlan:
+    """
+    Result of the solver: scheduled trips plus anything that did not fit a driver window
+    """
+
+    def __init__(self, trips, unscheduled, late_packages):
+        """
+        O(1) - Initializing the plan
+        - trips: List of scheduled Trips, ordered by start time
+        - unscheduled: List of Trips no driver could run inside their window
+        - late_packages: List of package ids delivered after their deadline
+        """
+        self.trips = trips
+        self.unscheduled = unscheduled
+        self.late_packages = late_packages
+        self.total_distance = sum(trip.distance for trip in trips)
+
+    def trips_by_truck(self):
+        """
+        O(n) - Scheduled trips grouped by truck, in the order they run
+
+        returns dictionary of truck id -> list of Trips
+        """
+        by_truck = {}
+        for trip in self.trips:
+            by_truck.setdefault(trip.truck, []).append(trip)
+        return by_truck
+
+
+def ready_time(package):
+    """
+    O(1) - Seconds since midnight a package can leave the hub: once it arrives (delayed) and once its
+    address is corrected (wrong address), 0 when it is there from the start
+    """
+    constraint = package.constraint
+    return max(constraint.available_after or 0, constraint.corrected_at or 0)
+
+
+def solve(packages, distances, drivers, trucks, capacity, mph, hub=0, reload_minutes=0, neighbors=20,
+          trips_per_truck=None):
+    """
+    O(n k log(n k)) - Plans every package onto trips, and every trip onto a driver and a truck
+    - packages: package objects (location_id, deadline_seconds, constraint and id are used)
+    - drivers: List of Drivers
+    - trucks: List of truck ids, a truck runs one trip at a time
+    - capacity: Integer, packages per trip
+    - mph: Float, average speed
+    - reload_minutes: minutes at the hub between two trips of the same truck or driver
+    - neighbors: savings are only computed between a stop and its nearest neighbors
+    - trips_per_truck: Integer, most trips one truck can run, None for no limit (with a limit, trips are
+      emptied into each other until the trucks can run them all, see reduce_trips)
+    - Raises ValueError for a co-delivery group pinned to two trucks or larger than a truckload
+
+    returns FleetPlan
+    """
+    trips = build_trips(packages, distances, capacity, mph, hub, drivers, neighbors)
+    if trips_per_truck is not None:
+        trips = reduce_trips(trips, packages, distances, capacity, mph, drivers, trips_per_truck * len(trucks))
+    return schedule_trips(trips, packages, distances, drivers, trucks, mph, reload_minutes, trips_per_truck)
+
+
+def build_trips(packages, distances, capacity, mph, hub, drivers, neighbors=20):
+    """
+    O(n k log(n k)) - Clarke-Wright savings construction followed by local search on each trip
+    - Stops with more packages than a truckload are split into several customers
+    - Every co-delivery group starts on one trip together, and its customers are never split up
+    - Packages pinned to the same truck start on one trip together, a truckload at a time
+    - Two trips are only merged if the load fits, the trip fits the longest driver window, they are not
+      pinned to different trucks, and leaving once every package is ready still meets every deadline
+      (checked in O(1) from each trip's latest start in both directions)
+
+    returns list of unscheduled Trips
+    """
+    d = distances.d
+    per_mile = 3600 / mph
+    earliest = min(driver.start for driver in drivers)
+    longest_shift = max(driver.end - driver.start for driver in drivers)
+
+    # customers are (location id, package ids), at most one truckload each, a group's packages
+    # at a location are one customer of their own and other packages are split by when they are ready
+    # and by the truck they are pinned to
+    groups = DeliveryGroups(packages)
+    by_unit = {}
+    for package in packages:
+        root = groups.find(package.id)
+        if groups.size[root] > 1:
+            unit = (root, None, None)
+        else:
+            unit = (None, ready_time(package), package.constraint.pinned_truck)
+        by_unit.setdefault((package.location_id,) + unit, []).append(package)
+    customers = []
+    grouped = {}
+    for (location, group, _, _), parcels in by_unit.items():
+        if group is None:
+            for i in range(0, len(parcels), capacity):
+                customers.append((location, parcels[i:i + capacity]))
+        else:
+            grouped.setdefault(group, []).append(len(customers))
+            customers.append((location, parcels))
+    due = [min(parcel.deadline_seconds for parcel in parcels) for _, parcels in customers]
+
+    def latest_start(unit):
+        # latest departure from the hub that still reaches every customer of the unit, in order, by its deadline
+        time, previous, latest = 0, hub, inf
+        for c in unit:
+            time += d(previous, customers[c][0]) * per_mile
+            latest = min(latest, due[c] - time)
+            previous = customers[c][0]
+        return latest
+
+    # every customer starts on its own trip (hub -> customer -> hub), every group on one trip,
+    # and customers pinned to one truck share a trip while it has room
+    in_group = {c for group in grouped.values() for c in group}
+    units = [[c] for c in range(len(customers)) if c not in in_group] + list(grouped.values())
+    seeds = {}
+    members = []
+    for unit in units:
+        parcels = [parcel for c in unit for parcel in customers[c][1]]
+        pinned = {parcel.constraint.pinned_truck for parcel in parcels} - {None}
+        if len(pinned) > 1:
+            raise ValueError(f'Packages {sorted(parcel.id for parcel in parcels)} must share a truck '
+                             f'but are pinned to trucks {sorted(pinned)}')
+        if len(parcels) > capacity:
+            raise ValueError(f'Packages {sorted(parcel.id for parcel in parcels)} must share a truck '
+                             f'but are more than a truckload')
+        pin = next(iter(pinned), None)
+        seed = seeds.get(pin)
+        if pin is not None and seed is not None and seed[1] + len(parcels) <= capacity:
+            seed[0].extend(unit)
+            seed[1] += len(parcels)
+            seed[2].extend(parcels)
+            continue
+        member = [list(unit), len(parcels), parcels, pin]
+        members.append(member)
+        if pin is not None:
+            seeds[pin] = member
+
+    routes = {}
+    route_of = [None] * len(customers)
+    summary = {}
+    for unit, load, parcels, pin in members:
+        unit.sort(key=lambda c: due[c])
+        stops = [hub] + [customers[c][0] for c in unit] + [hub]
+        r = unit[0]
+        routes[r] = deque(unit)
+        for c in unit:
+            route_of[c] = r
+        summary[r] = (load, sum(d(a, b) for a, b in zip(stops, stops[1:])),
+                      max(ready_time(parcel) for parcel in parcels),
+                      latest_start(unit), latest_start(reversed(unit)), pin)
+
+    def oriented(r, reverse):
+        # (first location, last location, miles between them, latest start, latest start reversed) of a trip
+        route = routes[r]
+        first, last = customers[route[0]][0], customers[route[-1]][0]
+        _, length, _, forward, backward, _ = summary[r]
+        inner = length - d(hub, first) - d(hub, last)
+        if reverse:
+            return last, first, inner, backward, forward
+        return first, last, inner, forward, backward
+
+    def joined(x, y):
+        # length and latest starts (both directions) of trip x followed by trip y
+        x_first, x_last, x_inner, x_forward, x_backward = x
+        y_first, y_last, y_inner, y_forward, y_backward = y
+        length = d(hub, x_first) + x_inner + d(x_last, y_first) + y_inner + d(y_last, hub)
+        forward = min(x_forward, y_forward - (x_inner + d(hub, x_first) + d(x_last, y_first) - d(hub, y_first)) * per_mile)
+        backward = min(y_backward, x_backward - (y_inner + d(hub, y_last) + d(y_first, x_last) - d(hub, x_last)) * per_mile)
+        return length, forward, backward
+
+    # savings of serving i and j on one trip, only between near neighbors
+    locations = tuple(sorted({location for location, _ in customers} | {hub}))
+    near = neighbor_lists(distances, locations, neighbors)
+    at_location = {}
+    for c, (location, _) in enumerate(customers):
+        at_location.setdefault(location, []).append(c)
+    savings = []
+    for i, (location_i, _) in enumerate(customers):
+        for other in near[location_i] + [location_i]:
+            for j in at_location.get(other, ()):
+                if i < j:
+                    saving = d(hub, location_i) + d(hub, other) - d(location_i, other)
+                    savings.append((-saving, i, j))
+    heapq.heapify(savings)
+
+    while savings:
+        _, i, j = heapq.heappop(savings)
+        a, b = route_of[i], route_of[j]
+        if a == b:
+            continue
+        # the smaller trip is merged into the larger one, so each customer moves O(log n) times
+        if len(routes[a]) < len(routes[b]):
+            a, b, i, j = b, a, j, i
+        route_a, route_b = routes[a], routes[b]
+        # i and j must both be at an end of their trip to join them with one edge
+        if i not in (route_a[0], route_a[-1]) or j not in (route_b[0], route_b[-1]):
+            continue
+
+        load_a, _, ready_a, _, _, pinned_a = summary[a]
+        load_b, _, ready_b, _, _, pinned_b = summary[b]
+        if load_a + load_b > capacity or (pinned_a is not None and pinned_b is not None and pinned_a != pinned_b):
+            continue
+        # the smaller trip goes on i's end, with j next to i
+        after = route_a[-1] == i
+        if after:
+            length, forward, backward = joined(oriented(a, False), oriented(b, route_b[0] != j))
+        else:
+            length, forward, backward = joined(oriented(b, route_b[-1] != j), oriented(a, False))
+        ready = max(ready_a, ready_b)
+        if length * per_mile > longest_shift or max(ready, earliest) > max(forward, backward) + EPSILON:
+            continue
+
+        if after:
+            if route_b[0] != j:
+                route_b.reverse()
+            route_a.extend(route_b)
+        else:
+            if route_b[-1] != j:
+                route_b.reverse()
+            route_a.extendleft(reversed(route_b))
+        for c in route_b:
+            route_of[c] = a
+        del routes[b]
+        del summary[b]
+        summary[a] = (load_a + load_b, length, ready, forward, backward,
+                      pinned_a if pinned_a is not None else pinned_b)
+
+    trips = []
+    for r, unit in routes.items():
+        _, _, ready, forward, backward, pinned = summary[r]
+        if backward > forward:
+            unit.reverse()
+        route = [hub]
+        visited = {hub}
+        package_ids = []
+        deadlines = {}
+        for c in unit:
+            location, parcels = customers[c]
+            if location not in visited:
+                visited.add(location)
+                route.append(location)
+            package_ids.extend(p.id for p in parcels)
+            deadlines[location] = min(due[c], deadlines.get(location, inf))
+        route.append(hub)
+        windows = TimeWindows(deadlines, max(ready, earliest), mph)
+        route = improve_route(route, distances, neighbor_lists(distances, tuple(sorted(set(route)))), windows)
+        trips.append(Trip(route, package_ids, distances.route_length(route), ready, pinned))
+
+    return trips
+
+
+def reduce_trips(trips, packages, distances, capacity, mph, drivers, target):
+    """
+    O(t^2 n^2) - Empties the trips with the fewest packages into the others until at most target trips are left
+    - A trip is only emptied when every one of its packages fits another trip: it has room, it is not pinned to
+      another truck (nor is another trip already pinned to the package's truck), and leaving once the package is
+      ready still meets every deadline (a trip carrying a co-delivery group is never emptied)
+    - Packages move tightest deadline first, each to the trip it lengthens the least
+
+    returns list of Trips, those that took packages are re-polished with the local search
+    """
+    by_id = {package.id: package for package in packages}
+    groups = DeliveryGroups(packages)
+    earliest = min(driver.start for driver in drivers)
+    longest_shift = max(driver.end - driver.start for driver in drivers)
+    per_mile = 3600 / mph
+
+    def windows(package_ids, ready):
+        deadlines = {}
+        for package_id in package_ids:
+            package = by_id[package_id]
+            deadlines[package.location_id] = min(package.deadline_seconds, deadlines.get(package.location_id, inf))
+        return TimeWindows(deadlines, max(ready, earliest), mph)
+
+    def empty(victim, others):
+        # (route, package ids, miles, ready, pinned truck) of every other trip once the victim's packages are moved
+        state = {trip: (list(trip.route), list(trip.package_ids), trip.distance, trip.ready, trip.pinned_truck)
+                 for trip in others}
+        for package in sorted((by_id[i] for i in victim.package_ids), key=lambda package: package.deadline_seconds):
+            if groups.size[groups.find(package.id)] > 1:
+                return None
+            pin = package.constraint.pinned_truck
+            best = None
+            for trip in others:
+                route, package_ids, miles, ready, pinned = state[trip]
+                if len(package_ids) >= capacity or (pin is not None and pinned is not None and pin != pinned):
+                    continue
+                if pin is not None and pinned is None and any(state[other][4] == pin for other in others):
+                    continue
+                ready = max(ready, ready_time(package))
+                times = windows(package_ids + [package.id], ready).route_times(route, distances)
+                if package.location_id in route:
+                    cost, p, on_time = 0, None, times.feasible()
+                else:
+                    cost, p, on_time = best_insertion(route, package.location_id, times, True)
+                if on_time and (miles + cost) * per_mile <= longest_shift and (best is None or cost < best[0]):
+                    best = (cost, p, trip, ready)
+            if best is None:
+                return None
+
+            cost, p, trip, ready = best
+            route, package_ids, miles, _, pinned = state[trip]
+            if p is not None:
+                route.insert(p + 1, package.location_id)
+            state[trip] = (route, package_ids + [package.id], miles + cost, ready, pinned if pin is None else pin)
+        return state
+
+    trips = list(trips)
+    while len(trips) > target:
+        for victim in sorted(trips, key=lambda trip: len(trip.package_ids)):
+            state = empty(victim, [trip for trip in trips if trip is not victim])
+            if state is not None:
+                break
+        else:
+            break
+
+        trips.remove(victim)
+        for trip, (route, package_ids, _, ready, pinned) in state.items():
+            if package_ids != trip.package_ids:
+                route = improve_route(route, distances, neighbor_lists(distances, tuple(sorted(set(route)))),
+                                      windows(package_ids, ready))
+                trip.route, trip.package_ids, trip.ready, trip.pinned_truck = route, package_ids, ready, pinned
+                trip.distance = distances.route_length(route)
+
+    return trips
+
+
+def schedule_trips(trips, packages, distances, drivers, trucks, mph, reload_minutes=0, trips_per_truck=None):
+    """
+    O(t log t + t * drivers * trucks) - Runs trips with the earliest deadline first on the driver and truck
+    that can finish them soonest, inside the driver's window
+    - A trip never leaves before it is ready, and a pinned trip only runs on its truck
+    - Ties go to a truck no pinned trip is still waiting for
+    - trips_per_truck: Integer, most trips one truck can run, None for no limit
+
+    returns FleetPlan
+    """
+    by_id = {package.id: package for package in packages}
+    reload = reload_minutes * 60
+    driver_free = {driver.id: driver.start for driver in drivers}
+    truck_free = {truck: min(driver.start for driver in drivers) for truck in trucks}
+    truck_trips = {truck: 0 for truck in trucks}
+
+    trips = sorted(trips, key=lambda trip: (min(by_id[i].deadline_seconds for i in trip.package_ids),
+                                            -trip.distance))
+    # trucks still needed by pinned trips, a free trip only takes one when no other truck finishes as soon
+    reserved = {}
+    for trip in trips:
+        if trip.pinned_truck is not None:
+            reserved[trip.pinned_truck] = reserved.get(trip.pinned_truck, 0) + 1
+    scheduled, unscheduled, late = [], [], []
+    for trip in trips:
+        duration = trip.distance / mph * 3600
+        if trip.pinned_truck is not None:
+            reserved[trip.pinned_truck] -= 1
+        best = None
+        for driver in drivers:
+            for truck in trucks:
+                if trip.pinned_truck is not None and truck != trip.pinned_truck:
+                    continue
+                if trips_per_truck is not None and truck_trips[truck] >= trips_per_truck:
+                    continue
+                start = max(driver_free[driver.id], truck_free[truck], driver.start, trip.ready)
+                end = round(start + duration)
+                choice = (end, reserved.get(truck, 0) > 0)
+                if end <= driver.end and (best is None or choice < best[0]):
+                    best = (choice, start, driver, truck)
+
+        if best is None:
+            unscheduled.append(trip)
+            continue
+
+        (end, _), start, driver, truck = best
+        trip.start_time, trip.end_time, trip.driver, trip.truck = start, end, driver.id, truck
+        driver_free[driver.id] = end + reload
+        truck_free[truck] = end + reload
+        truck_trips[truck] += 1
+
+        # delivery times along the trip
+        current_time = start
+        delivered_at = {}
+        for current_location, next_location in zip(trip.route, trip.route[1:]):
+            current_time += distances.d(current_location, next_location) / mph * 3600
+            delivered_at.setdefault(next_location, round(current_time))
+        for package_id in trip.package_ids:
+            delivery_time = delivered_at[by_id[package_id].location_id]
+            trip.delivery_times[package_id] = delivery_time
+            if delivery_time > by_id[package_id].deadline_seconds:
+                late.append(package_id)
+        scheduled.append(trip)
+
+    scheduled.sort(key=lambda trip: trip.start_time)
+    return FleetPlan(scheduled, unscheduled, late)
+
+
+def _clock_seconds(moment):
+    """
+    O(1) - Whole seconds since midnight of a 'HH:MM:SS' string (times, datetimes and numbers, see Timeline.seconds)
+    """
+    if isinstance(moment, str):
+        moment = datetime.strptime(moment, '%H:%M:%S')
+    return round(seconds(moment))